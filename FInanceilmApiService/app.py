@@ -0,0 +1,432 @@
+from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
+from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from typing import Optional, List
+from pydantic import BaseModel
+import os
+import json
+import asyncio
+import math
+import time
+import warnings
+
+from dotenv import load_dotenv
+load_dotenv()
+
+# --- your existing imports ---
+from src.models import QuestionInput, BatchInput
+from src.services.openaiservice import record_usage
+from src.financeilm import FinanceILM
+from src.services.v1 import acompletion_v1, completion_v1_stream
+from src.services.logservice import logging
+from src.services.metricsservice import metrics
+from src.services.admissionservice import admission, AdmissionRejected, estimate_request_tokens
+from src.services.retryservice import set_request_deadline
+from src.services.streamservice import encode_event, chunk_delta, guarded_stream, DeltaCoalescer, FrameMeter
+from src.config import completion_kwargs
+from src.services.readinessservice import readiness
+from src.services.executorservice import blocking
+from src.services.sessionservice import sessions, SessionNotFound
+from src.services.routingservice import router
+from src.services.lexicalservice import lexical
+from src.services.contextstore import context_payload, fetch_context, CONTEXT_TTL_S
+from fastapi.responses import Response
+from fastapi.responses import JSONResponse
+
+warnings.filterwarnings("ignore")
+
+# =========================
+# Security: Bearer Token
+# =========================
+security = HTTPBearer(auto_error=False)  # let us raise our own 401
+
+API_TOKEN = os.getenv("FINANCEILM_API_TOKEN")
+if not API_TOKEN:
+    logging.warning("FINANCEILM_API_TOKEN is not set. All requests will fail with 401.")
+
+def require_bearer_token(
+    creds: HTTPAuthorizationCredentials = Depends(security)
+) -> str:
+    """
+    Dependency to require Authorization: Bearer <token>.
+    Validates against FINANCEILM_API_TOKEN and returns the token (used as the admission key).
+    """
+    if creds is None or creds.scheme.lower() != "bearer":
+        raise HTTPException(status_code=401, detail="Unauthorized: Bearer token required")
+    token = creds.credentials
+    if not API_TOKEN or token != API_TOKEN:
+        raise HTTPException(status_code=401, detail="Unauthorized: Invalid token")
+    return token
+
+
+# =========================
+# Admission control
+# =========================
+BATCH_ADMISSION_RETRIES = int(os.getenv("BATCH_ADMISSION_RETRIES", "5"))
+
+async def admit_request(token: str, messages, prompt_tokens: Optional[int] = None):
+    """
+    Admits a request through the admission controller or fails fast with 429 + Retry-After.
+    """
+    try:
+        return await admission.acquire(token, estimate_request_tokens(messages, prompt_tokens))
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"FinanceILM: Too many requests ({e.reason}). Please retry later.",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
+
+
+async def request_messages(data: QuestionInput):
+    """
+    History for this turn, its token count if already known, and the session turn to commit
+    once answered: the posted `messages`, or, with a session_id, the server-side session
+    window plus the new message (nothing is stored until SessionStore.commit).
+    """
+    if not data.session_id:
+        return data.messages + ([data.message] if data.message else []), None, None
+    try:
+        turn = await sessions.begin(data.session_id, data.messages, data.message)
+    except SessionNotFound:
+        raise HTTPException(
+            status_code=409,
+            detail="FinanceILM: Unknown or expired session; resend the conversation in `messages`",
+        )
+    return turn.messages, turn.tokens, turn
+
+
+# =========================
+# Batch settings
+# =========================
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+
+
+# =========================
+# App & CORS
+# =========================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy modules/clients (tiktoken encoding, openai, chromadb) are built by the
+    # warm-up here or on first use, never at import. /readyz reports when it is done.
+    readiness.start()
+    lexical.start()  # keyword index over the retrieval collection, built in the background
+    yield
+    lexical.stop()
+    blocking.shutdown()
+
+
+app = FastAPI(title="FINANCEILM", version="1.0.0", lifespan=lifespan)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],           # tighten this in production
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*", "Authorization"],  # ensure Authorization header is allowed
+)
+
+# =========================
+# Models (legacy support)
+# =========================
+class LegacyQuestionInput(BaseModel):
+    Question: str
+    queries: List[dict] = []
+    flag: Optional[str] = "False"
+    source: Optional[str] = "site"
+
+chatIlm = FinanceILM()
+
+# =========================
+# Routes
+# =========================
+
+@app.post("/api/v1/context-in-usage")
+async def completionWithContextInUsage(
+    data: QuestionInput, request: Request, token: str = Depends(require_bearer_token)
+):
+    if len(data.messages) == 0 and data.message is None:
+        raise HTTPException(
+            status_code=400,
+            detail="FinanceILM: Please provide a message to generate a completion",
+        )
+
+    set_request_deadline()
+    messages, prompt_tokens, session_turn = await request_messages(data)
+    ticket = await admit_request(token, messages, prompt_tokens)
+    try:
+        try:
+            started = time.monotonic()
+            context = await chatIlm.get_context(messages[-1].content, data.referrer)
+            retrieval_ms = (time.monotonic() - started) * 1000
+            with open("context.txt", "w", encoding="utf-8") as file:
+                file.write(context[0])
+        except Exception as e:
+            logging.error(f"Error retrieving context from Chromadb: {e}")
+            raise HTTPException(status_code=500, detail="Internal server error: Error retrieving context")
+
+        # inline text, or a compact reference served by GET /api/v1/context/{id}
+        context_info = await context_payload(context, data.context_mode)
+        # off-topic first question -> canned exit_text (no LLM call); simple + confident -> light profile
+        route = router.route(messages[-1].content, context, follow_up=len(messages) > 1)
+        max_tokens = route.overrides.get("max_tokens", completion_kwargs["max_tokens"])
+
+        async def record_reply(text: str) -> None:
+            # session mode: the answered turn becomes the window for the next one
+            if session_turn is not None:
+                await sessions.commit(session_turn, text)
+
+        async def parse_stream():
+            coalescer, meter = DeltaCoalescer(), FrameMeter()
+            pending = None  # last content chunk, used as the frame for buffered text
+            reply = []
+            answered = False
+
+            def frame(chunk_json_obj):
+                return meter.count(f"{json.dumps(chunk_json_obj)}\n\n")
+
+            def with_content(chunk_json_obj, text):
+                chunk_json_obj["choices"][0]["delta"]["content"] = text
+                return chunk_json_obj
+
+            try:
+                # opened only once the response is being sent: a client that is already gone
+                # never starts an upstream stream (and the ticket goes back via the background task)
+                stream = await completion_v1_stream(context, messages, data.referrer, route)
+                # stops pulling tokens from OpenAI as soon as the client disconnects
+                async for chunk in guarded_stream(stream, request.is_disconnected, max_tokens):
+                    # normalize OpenAI chunk to JSON
+                    chunk_json_obj = json.loads(chunk.model_dump_json())
+                    delta = chunk_delta(chunk)
+                    if delta:
+                        reply.append(delta)
+                        pending = chunk_json_obj
+                        text = coalescer.push(delta)
+                        if text is not None:
+                            yield frame(with_content(pending, text))
+                        continue
+                    # non-content chunk (role, finish_reason, usage): flush buffered text first
+                    text = coalescer.flush()
+                    if text is not None:
+                        yield frame(with_content(pending, text))
+                    # include context when usage arrives (tail of stream)
+                    if chunk_json_obj.get("usage"):
+                        record_usage(chunk_json_obj["usage"])
+                        ticket.record_usage(chunk_json_obj["usage"])
+                        chunk_json_obj["context"] = context_info
+                    yield frame(chunk_json_obj)
+                text = coalescer.flush()
+                if text is not None:
+                    yield frame(with_content(pending, text))
+                # an abandoned stream isn't an answered turn: the client will resend the message
+                answered = not await request.is_disconnected()
+            except Exception as e:
+                # headers are already sent: report the failure in-band, like event_stream
+                logging.error(f"Error while streaming completion: {e}")
+                yield frame({"error": {"detail": "Sorry, there was an issue processing your request. Please refresh and try again."}})
+            finally:
+                meter.close()
+                ticket.release()
+            if answered:
+                await record_reply("".join(reply))
+
+        async def event_stream():
+            coalescer, meter = DeltaCoalescer(), FrameMeter()
+            reply = []
+            answered = False
+            # sources go out first, before the upstream call is even opened
+            try:
+                yield meter.count(encode_event("context", context_info))
+                stream = await completion_v1_stream(context, messages, data.referrer, route)
+                first_token_ms = None
+                usage = None
+                async for chunk in guarded_stream(stream, request.is_disconnected, max_tokens):
+                    if getattr(chunk, "usage", None) is not None:
+                        usage = chunk.usage.model_dump()
+                        record_usage(usage)
+                        ticket.record_usage(usage)
+                    delta = chunk_delta(chunk)
+                    if delta:
+                        reply.append(delta)
+                        if first_token_ms is None:
+                            first_token_ms = (time.monotonic() - started) * 1000
+                        text = coalescer.push(delta)
+                        if text is not None:
+                            yield meter.count(encode_event("delta", {"content": text}))
+                text = coalescer.flush()
+                if text is not None:
+                    yield meter.count(encode_event("delta", {"content": text}))
+                yield meter.count(encode_event("usage", {
+                    "usage": usage,
+                    "timing": {
+                        "retrieval_ms": round(retrieval_ms, 1),
+                        "first_token_ms": round(first_token_ms, 1) if first_token_ms is not None else None,
+                        "total_ms": round((time.monotonic() - started) * 1000, 1),
+                    },
+                }))
+                answered = not await request.is_disconnected()
+            except Exception as e:
+                logging.error(f"Error while streaming completion: {e}")
+                yield meter.count(encode_event("error", {"detail": "Sorry, there was an issue processing your request. Please refresh and try again."}))
+            finally:
+                meter.close()
+                ticket.release()
+            if answered:
+                await record_reply("".join(reply))
+
+        if getattr(data, "stream", False) and data.stream_protocol == "events":
+            return StreamingResponse(
+                event_stream(), media_type="application/x-ndjson", background=BackgroundTask(ticket.release)
+            )
+        if getattr(data, "stream", False):
+            # the slot is held until the stream ends; the background task covers unstarted streams
+            return StreamingResponse(
+                parse_stream(), media_type="application/json", background=BackgroundTask(ticket.release)
+            )
+        else:
+            res = await acompletion_v1(context, messages, data.referrer, route)
+            ticket.record_usage(res.usage)
+            ticket.release()
+            await record_reply(res.choices[0].message.content if res.choices else "")
+            res = dict(res)
+            res.update({"context": context_info})
+            return res
+    except BaseException:
+        ticket.release()
+        raise
+
+
+@app.get("/api/v1/context/{context_id}", dependencies=[Depends(require_bearer_token)])
+async def getContext(context_id: str, request: Request):
+    """
+    Full text of a context returned by reference (context_mode="reference").
+    Ids are content hashes, so the id is a strong ETag and the body never changes.
+    """
+    # look the entry up first: an expired or unknown id is a 404 even for a conditional request
+    stored = await fetch_context(context_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="FinanceILM: Context not found or expired")
+    etag = f'"{context_id}"'
+    headers = {"ETag": etag, "Cache-Control": f"private, max-age={int(CONTEXT_TTL_S)}, immutable"}
+    if request.headers.get("if-none-match") in (etag, "*"):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content={"id": context_id, **stored}, headers=headers)
+
+
+@app.post("/api/v1/batch")
+async def batchCompletion(data: BatchInput, token: str = Depends(require_bearer_token)):
+    """
+    Answers many questions in one call. Questions are embedded in one batched request,
+    retrieval + completion run with bounded concurrency, and results stream back as
+    NDJSON in completion order: {"index": i, "result": {...}} or {"index": i, "error": "..."}.
+    """
+    if len(data.items) == 0:
+        raise HTTPException(status_code=400, detail="FinanceILM: Please provide at least one item")
+
+    # sessions are per-conversation server state; batch items carry their whole conversation
+    if any(item.session_id for item in data.items):
+        raise HTTPException(
+            status_code=422,
+            detail="FinanceILM: session_id is not supported in batch items; send the conversation in `messages`",
+        )
+    conversations = [item.messages + ([item.message] if item.message else []) for item in data.items]
+    questions = [conv[-1].content if conv else "" for conv in conversations]
+    to_embed = [i for i, q in enumerate(questions) if q]
+    try:
+        vectors = await chatIlm.embed_questions([questions[i] for i in to_embed])
+    except Exception as e:
+        logging.error(f"Error embedding batch questions: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error: Error embedding questions")
+    embeddings = dict(zip(to_embed, vectors))
+
+    concurrency = max(1, min(data.concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def admit_item(index: int):
+        # batch items wait for capacity instead of failing; the token bucket paces them
+        for attempt in range(BATCH_ADMISSION_RETRIES + 1):
+            try:
+                return await admission.acquire(token, estimate_request_tokens(conversations[index]))
+            except AdmissionRejected as e:
+                if attempt == BATCH_ADMISSION_RETRIES:
+                    raise
+                await asyncio.sleep(e.retry_after)
+
+    async def run_item(index: int, item: QuestionInput) -> dict:
+        async with semaphore:
+            # each task runs in its own context copy, so the deadline is per item
+            set_request_deadline()
+            try:
+                if index not in embeddings:
+                    raise ValueError("Please provide a message to generate a completion")
+                ticket = await admit_item(index)
+            except Exception as e:
+                logging.error(f"Batch item {index} failed: {e}")
+                return {"index": index, "error": str(e)}
+            try:
+                context = await chatIlm.get_context(questions[index], item.referrer, query_embedding=embeddings[index])
+                if context[0] is None:
+                    raise RuntimeError("Error retrieving context")
+                route = router.route(questions[index], context, follow_up=len(conversations[index]) > 1)
+                res = await acompletion_v1(context, conversations[index], item.referrer, route)
+                ticket.record_usage(res.usage)
+                res = res.model_dump()
+                res["context"] = await context_payload(context, item.context_mode)
+                return {"index": index, "result": res}
+            except Exception as e:
+                logging.error(f"Batch item {index} failed: {e}")
+                return {"index": index, "error": str(e)}
+            finally:
+                ticket.release()
+
+    async def ndjson_results():
+        tasks = [asyncio.create_task(run_item(i, item)) for i, item in enumerate(data.items)]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done) + "\n"
+        finally:
+            # client went away: don't keep spending tokens on the rest of the batch
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(ndjson_results(), media_type="application/x-ndjson")
+
+
+# Optional: a public healthcheck if you want something unprotected
+# @app.get("/healthz")
+# async def healthz():
+#     return {"status": "ok"}
+# --- add this public healthcheck (no auth) ---
+@app.get("/healthz")
+async def healthz():
+    return {"ok": True}
+
+# readiness (no auth): 503 until the worker is warm (Chroma, tokenizer, OpenAI connections)
+@app.get("/readyz")
+async def readyz():
+    status = readiness.status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+# (optional) add a friendly public landing page
+@app.get("/public")
+async def public_root():
+    return {"status": "ok", "service": "FinanceILM API Version 1.0.0"}
+
+# process-local metrics (rerank savings, etc.)
+@app.get("/metrics", dependencies=[Depends(require_bearer_token)])
+async def get_metrics():
+    return metrics.snapshot()
+
+# keep this protected root (requires Authorization: Bearer <token>)
+@app.get("/", dependencies=[Depends(require_bearer_token)])
+async def home():
+    return {"status": "ok", "service": "FinanceILM API"}
+
+if __name__ == "__main__":
+    import uvicorn
+    # Use --proxy-headers and --forwarded-allow-ips if you're behind a proxy
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,103 @@
+"""
+Startup-time benchmark for the FinanceILM API.
+
+1. `python -X importtime -c "import app"`: total import time plus the slowest
+   top-level packages (sum of the self times of all their modules).
+2. Time-to-first-200: boots uvicorn on a free port and polls /healthz until it answers 200.
+
+Usage (from the FInanceilmApiService directory):
+    python scripts/bench_startup.py [--top 15] [--runs 3]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_breakdown(top: int):
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=SERVICE_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        raise SystemExit("importing app failed")
+
+    by_package = defaultdict(int)
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            self_us, cumulative_us, name = [p.strip() for p in line[len("import time:"):].split("|")]
+            self_time, cumulative = int(self_us), int(cumulative_us)
+        except ValueError:
+            continue  # header line
+        by_package[name.split(".")[0]] += self_time
+        if name == "app":
+            total_us = cumulative
+    return total_us, sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_200(timeout: float = 60.0) -> float:
+    port = free_port()
+    started = time.monotonic()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=SERVICE_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.monotonic() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.monotonic() - started
+            except (urllib.error.URLError, ConnectionError, OSError):
+                pass
+            if proc.poll() is not None:
+                raise SystemExit("uvicorn exited before serving /healthz")
+            time.sleep(0.02)
+        raise SystemExit("timed out waiting for /healthz")
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--top", type=int, default=15, help="number of packages to show")
+    parser.add_argument("--runs", type=int, default=3, help="boots to average for time-to-first-200")
+    args = parser.parse_args()
+
+    total_us, packages = import_breakdown(args.top)
+    print(f"import app: {total_us / 1000:.1f} ms")
+    print(f"{'package':<32}{'self ms':>14}")
+    for name, us in packages:
+        print(f"{name:<32}{us / 1000:>14.1f}")
+
+    samples = [time_to_first_200() for _ in range(args.runs)]
+    print(f"\ntime-to-first-200 (/healthz): median {statistics.median(samples) * 1000:.0f} ms "
+          f"over {len(samples)} runs (min {min(samples) * 1000:.0f}, max {max(samples) * 1000:.0f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Offline retrieval evaluation: recall, MRR, prompt size and latency per search configuration.
+
+Runs a labeled query set through ChromaService.get_context_info_optimized (the code the API
+uses) for every combination of --collections, --modes and --k, then applies each
+--max-distance cutoff to the chunks it returned, and prints one comparison row per configuration.
+
+1. embed: computes the query embeddings once (the only step that calls OpenAI) and stores
+   them in an .npz file; later runs reuse them, so evaluation needs no network access
+   beyond the Chroma server.
+2. run: evaluates the configurations; it needs no OPENAI_API_KEY. Point CHROMA_HOST/CHROMA_PORT at a local Chroma
+   serving a snapshot of the collection (e.g. `chroma run --path <copy of the persist dir>`)
+   to evaluate fully offline. tiktoken's encoding must be in its cache (TIKTOKEN_CACHE_DIR)
+   for the token counts.
+
+Labels are JSONL, one query per line:
+    {"question": "What is tawarruq?", "relevant": ["chunk-id-1", "chunk-id-2"]}
+
+Modes:
+    vector      top-k by vector distance (CONTEXT_K)
+    mmr         MMR rerank of fetch-k vector candidates (MMRReranker)
+    hybrid      vector + in-process BM25 index, fused with RRF; confident lookups skip the vector query
+    hybrid_mmr  hybrid, then MMR rerank
+Reduced-dimension copies (scripts/migrate_dimensions.py) are compared by listing them in --collections.
+
+Columns: recall = relevant chunks retrieved / relevant chunks; MRR = 1 / rank of the first
+relevant chunk; empty = queries left with no chunk; lexical = queries answered from the BM25
+index alone; tokens = system prompt tokens (instructions + context) per query.
+
+Usage (from the FInanceilmApiService directory):
+    python scripts/eval_retrieval.py embed --labels eval/labels.jsonl --embeddings eval/queries.npz
+    python scripts/eval_retrieval.py run --labels eval/labels.jsonl --embeddings eval/queries.npz \\
+        --collections financeilm,financeilm_d512 --modes vector,mmr,hybrid --k 4,8 --max-distance none,1.2
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+from src.config import get_tokenizer  # noqa: E402
+from src.prompt import prompts_on_source  # noqa: E402
+from src.services.chromaservice import ChromaService  # noqa: E402
+from src.services.lexicalservice import lexical  # noqa: E402
+from src.services.metricsservice import metrics  # noqa: E402
+from src.services.rerankservice import MMRReranker  # noqa: E402
+
+MODES = ("vector", "mmr", "hybrid", "hybrid_mmr")
+
+
+def load_labels(path: str) -> List[Dict[str, Any]]:
+    labels = []
+    with open(path, encoding="utf-8") as f:
+        for n, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if not row.get("question") or not row.get("relevant"):
+                raise SystemExit(f"{path}:{n}: expected {{\"question\": ..., \"relevant\": [chunk ids]}}")
+            labels.append({"question": row["question"], "relevant": [str(r) for r in row["relevant"]]})
+    return labels
+
+
+def load_embeddings(path: str) -> Tuple[Dict[str, np.ndarray], Optional[str]]:
+    if not os.path.exists(path):
+        return {}, None
+    data = np.load(path)
+    model = str(data["model"]) if "model" in data else None
+    return dict(zip(data["questions"].tolist(), data["embeddings"])), model
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else 0.0
+
+
+# ---------- embed ----------
+
+async def embed(args: argparse.Namespace) -> None:
+    svc = ChromaService()
+    questions = [row["question"] for row in load_labels(args.labels)]
+    cached, model = load_embeddings(args.embeddings)
+    if cached and model and model != svc.embedding_model:
+        raise SystemExit(f"{args.embeddings} holds {model} vectors; EMBEDDING_MODEL is {svc.embedding_model}")
+    missing = list(dict.fromkeys(q for q in questions if q not in cached))
+    for start in range(0, len(missing), args.batch_size):
+        batch = missing[start:start + args.batch_size]
+        # full size: reduced-dimension collections shorten the vector themselves
+        cached.update(zip(batch, np.asarray(await svc._embed_many(batch), dtype=np.float32)))
+        print(f"  embedded {start + len(batch)}/{len(missing)}", end="\r", flush=True)
+    os.makedirs(os.path.dirname(os.path.abspath(args.embeddings)), exist_ok=True)
+    np.savez(
+        args.embeddings,
+        questions=np.array(list(cached)),
+        embeddings=np.stack(list(cached.values())),
+        model=np.array(svc.embedding_model),
+    )
+    print(f"\n{len(missing)} new, {len(cached)} total query embeddings in {args.embeddings}")
+
+
+# ---------- run ----------
+
+def score_query(results: Tuple[List[str], List[Optional[float]], List[Optional[str]]], relevant: List[str],
+                max_distance: Optional[float]) -> Dict[str, float]:
+    texts, distances, chunk_ids = results
+    # lexical-only chunks without a distance are exact-term matches: no cutoff applies
+    kept = [i for i, d in enumerate(distances) if max_distance is None or d is None or d <= max_distance]
+    ids = [chunk_ids[i] for i in kept]
+    relevant_set = set(relevant)
+    first = next((rank for rank, cid in enumerate(ids, start=1) if cid in relevant_set), None)
+    text = "\n\n".join(texts[i] for i in kept)
+    measured = [distances[i] for i in kept if distances[i] is not None]
+    score = float(np.mean(measured)) if measured else (None if kept else 0)
+    return {
+        "recall": len(relevant_set.intersection(ids)) / len(relevant_set),
+        "mrr": 1.0 / first if first else 0.0,
+        "empty": 0.0 if kept else 1.0,
+        "tokens": len(get_tokenizer().encode(prompts_on_source("site", text, score), disallowed_special=())),
+    }
+
+
+async def run_config(svc: ChromaService, labels: List[Dict[str, Any]], vectors: Dict[str, np.ndarray],
+                     mode: str, k: int, fetch_k: Optional[int], runs: int):
+    """Returns per-query (texts, distances, chunk ids), retrieval latencies (ms) and lexical-only answers."""
+    lexical.enabled = mode.startswith("hybrid")
+    reranker = MMRReranker(k=k, fetch_k=fetch_k) if mode.endswith("mmr") else None
+    svc.context_k = k
+    before = metrics.snapshot()["counters"].get("retrieval.lexical_only", 0)
+    results, latencies = [], []
+    for run in range(runs):
+        for row in labels:
+            started = time.perf_counter()
+            # get_context_info_optimized prints the retrieved metadata; keep the table readable
+            with contextlib.redirect_stdout(io.StringIO()):
+                texts, _links, distances, chunk_ids, _strengths = await svc.get_context_info_optimized(
+                    row["question"], "site", reranker=reranker, query_embedding=vectors[row["question"]].tolist()
+                )
+            latencies.append((time.perf_counter() - started) * 1000)
+            if run == 0:
+                results.append((texts, distances, chunk_ids))
+    lexical_only = (metrics.snapshot()["counters"].get("retrieval.lexical_only", 0) - before) / runs
+    return results, latencies, lexical_only
+
+
+async def run(args: argparse.Namespace) -> None:
+    labels = load_labels(args.labels)[: args.limit]
+    vectors, model = load_embeddings(args.embeddings)
+    missing = [row["question"] for row in labels if row["question"] not in vectors]
+    if missing:
+        raise SystemExit(f"{len(missing)} questions have no embedding in {args.embeddings}; run `embed` first")
+
+    # no OpenAI client: every query vector comes from the .npz
+    svc = ChromaService(embeddings=False)
+    if model and model != svc.embedding_model:
+        raise SystemExit(f"{args.embeddings} holds {model} vectors; EMBEDDING_MODEL is {svc.embedding_model}")
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        raise SystemExit(f"unknown modes {sorted(unknown)}; choose from {', '.join(MODES)}")
+    cutoffs = [None if c == "none" else float(c) for c in args.max_distance.split(",") if c]
+
+    rows = []
+    for collection in [c for c in args.collections.split(",") if c]:
+        svc.retrieval_collection = collection
+        await svc.get_chroma_collection(collection)
+        dims = await svc.get_collection_dimensions(collection)
+        if any(m.startswith("hybrid") for m in modes):
+            lexical.enabled = True
+            await lexical.build(svc, collection)
+        for mode, k in itertools.product(modes, [int(k) for k in args.k.split(",") if k]):
+            results, latencies, lexical_only = await run_config(svc, labels, vectors, mode, k, args.fetch_k, args.runs)
+            for cutoff in cutoffs:
+                scored = [score_query(r, row["relevant"], cutoff) for r, row in zip(results, labels)]
+                rows.append({
+                    "collection": collection,
+                    "dims": dims,
+                    "mode": mode,
+                    "k": k,
+                    "max_distance": cutoff,
+                    **{name: statistics.mean(s[name] for s in scored) for name in ("recall", "mrr", "empty", "tokens")},
+                    "lexical": lexical_only / len(labels),
+                    "p50_ms": percentile(latencies, 0.50),
+                    "p99_ms": percentile(latencies, 0.99),
+                })
+
+    print(f"\n{len(labels)} labeled queries x {args.runs} runs")
+    print(f"{'collection':<24}{'dims':>6}{'mode':>12}{'k':>4}{'cutoff':>8}{'recall':>8}{'MRR':>7}"
+          f"{'empty%':>8}{'lexical%':>10}{'tokens':>8}{'p50 ms':>8}{'p99 ms':>8}")
+    for r in rows:
+        cutoff = "-" if r["max_distance"] is None else f"{r['max_distance']:g}"
+        print(f"{r['collection']:<24}{r['dims'] or '-':>6}{r['mode']:>12}{r['k']:>4}{cutoff:>8}"
+              f"{r['recall']:>8.3f}{r['mrr']:>7.3f}{100 * r['empty']:>8.1f}{100 * r['lexical']:>10.1f}"
+              f"{r['tokens']:>8.0f}{r['p50_ms']:>8.1f}{r['p99_ms']:>8.1f}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+        print(f"results written to {args.out}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_embed = sub.add_parser("embed", help="precompute the query embeddings (calls OpenAI)")
+    p_embed.add_argument("--labels", required=True, help="JSONL of {question, relevant}")
+    p_embed.add_argument("--embeddings", required=True, help=".npz file to create or extend")
+    p_embed.add_argument("--batch-size", type=int, default=256)
+
+    p_run = sub.add_parser("run", help="evaluate the configurations (no OpenAI calls)")
+    p_run.add_argument("--labels", required=True, help="JSONL of {question, relevant}")
+    p_run.add_argument("--embeddings", required=True, help=".npz written by `embed`")
+    p_run.add_argument("--collections", default=os.getenv("RETRIEVAL_COLLECTION", "financeilm"),
+                       help="comma-separated collections, e.g. financeilm,financeilm_d512")
+    p_run.add_argument("--modes", default="vector,mmr,hybrid,hybrid_mmr", help=f"comma-separated: {','.join(MODES)}")
+    p_run.add_argument("--k", default="8", help="comma-separated chunk counts")
+    p_run.add_argument("--fetch-k", type=int, help="MMR candidates (default: MMR_FETCH_K or 2k)")
+    p_run.add_argument("--max-distance", default="none", help="comma-separated distance cutoffs; 'none' keeps all")
+    p_run.add_argument("--limit", type=int, help="evaluate only the first N labeled queries")
+    p_run.add_argument("--runs", type=int, default=1, help="passes over the queries for latency")
+    p_run.add_argument("--out", help="also write the rows as JSON")
+
+    args = parser.parse_args()
+    asyncio.run(embed(args) if args.command == "embed" else run(args))
+
+
+if __name__ == "__main__":
+    main()
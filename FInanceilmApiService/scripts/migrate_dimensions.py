@@ -0,0 +1,172 @@
+"""
+Builds reduced-dimension copies of a Chroma collection and benchmarks them against the original.
+
+1. Copy: for every size in --dimensions, creates <source>_d<dims> with the same documents,
+   ids and metadata, and records embedding_model/embedding_dimensions in its metadata.
+     --mode truncate  shortens the stored vectors (truncate + L2-normalize; exact for text-embedding-3)
+     --mode reembed   re-embeds every document with the API's `dimensions` parameter
+2. Benchmark: runs the --queries (one per line) against the source and each copy and reports
+   query latency (p50/p99), vector memory and query payload size, and recall@k, taking the
+   source collection's top-k as ground truth.
+
+Point the API at a copy with RETRIEVAL_COLLECTION=<source>_d<dims> (and, optionally,
+COLLECTION_EMBEDDING_DIMENSIONS=<source>_d<dims>=<dims> to pin it).
+
+Usage (from the FInanceilmApiService directory):
+    python scripts/migrate_dimensions.py --source financeilm --dimensions 256,512,1024 --queries queries.txt
+    python scripts/migrate_dimensions.py --source financeilm --dimensions 512 --queries queries.txt --bench-only
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+from src.services.chromaservice import (  # noqa: E402
+    META_EMBEDDING_DIMENSIONS,
+    META_EMBEDDING_MODEL,
+    SHORTENABLE_EMBEDDING_MODELS,
+    ChromaService,
+    reduce_embedding,
+)
+from src.services.readinessservice import load_warmup_queries  # noqa: E402
+
+# chromadb's default HNSW graph degree; used to estimate the per-vector link overhead
+HNSW_M = 16
+
+
+def target_name(source: str, dimensions: int) -> str:
+    return f"{source}_d{dimensions}"
+
+
+async def copy_collection(
+    svc: ChromaService, source: str, dimensions: int, mode: str, batch_size: int, replace: bool
+) -> int:
+    client = await svc.get_chroma_client()
+    src = await svc.get_chroma_collection(source)
+    name = target_name(source, dimensions)
+    if replace:
+        try:
+            await client.delete_collection(name)
+        except Exception:
+            pass
+        svc._collections.pop(name, None)
+
+    # keep the source's distance settings (hnsw:*) so results stay comparable
+    metadata = {k: v for k, v in (src.metadata or {}).items() if k.startswith("hnsw:")}
+    metadata.update({META_EMBEDDING_MODEL: svc.embedding_model, META_EMBEDDING_DIMENSIONS: dimensions,
+                     "source_collection": source})
+    await client.get_or_create_collection(name=name, metadata=metadata)
+    dst = await svc.get_chroma_collection(name, dimensions=dimensions)
+
+    copied, offset = 0, 0
+    while True:
+        page = await src.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        documents = page.get("documents") or [""] * len(ids)
+        if mode == "reembed":
+            embeddings = await svc._embed_many(list(documents), dimensions)
+        else:
+            embeddings = [reduce_embedding(e, dimensions) for e in page["embeddings"]]
+        await dst.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=page.get("metadatas"))
+        copied += len(ids)
+        offset += len(ids)
+        print(f"  {name}: {copied} records", end="\r", flush=True)
+    print(f"  {name}: {copied} records")
+    return copied
+
+
+async def bench_collection(col: Any, vectors: List[List[float]], k: int, runs: int) -> Dict[str, Any]:
+    await col.query(query_embeddings=[vectors[0]], n_results=k, include=[])  # warm the connection/index
+    latencies, results = [], []
+    for _ in range(runs):
+        results = []
+        for v in vectors:
+            started = time.perf_counter()
+            raw = await col.query(query_embeddings=[v], n_results=k, include=[])
+            latencies.append((time.perf_counter() - started) * 1000)
+            results.append(raw["ids"][0])
+    latencies.sort()
+    count = await col.count()
+    dims = len(vectors[0])
+    return {
+        "ids": results,
+        "dims": dims,
+        "count": count,
+        "vector_mib": count * dims * 4 / 2 ** 20,
+        "index_mib": count * (dims * 4 + 2 * HNSW_M * 4) / 2 ** 20,
+        "payload_bytes": statistics.mean(len(json.dumps(v)) for v in vectors),
+        "p50_ms": latencies[len(latencies) // 2],
+        "p99_ms": latencies[min(len(latencies) - 1, int(round(0.99 * (len(latencies) - 1))))],
+    }
+
+
+def recall_at_k(truth: List[List[str]], found: List[List[str]], k: int) -> float:
+    hits = [len(set(t[:k]) & set(f[:k])) / max(1, min(k, len(t))) for t, f in zip(truth, found)]
+    return statistics.mean(hits) if hits else 0.0
+
+
+async def run(args: argparse.Namespace) -> None:
+    svc = ChromaService()
+    sizes = [int(d) for d in args.dimensions.split(",") if d]
+    src = await svc.get_chroma_collection(args.source)
+    source_dims: Optional[int] = svc._dimensions.get(args.source)
+    if svc.embedding_model not in SHORTENABLE_EMBEDDING_MODELS:
+        raise SystemExit(f"{svc.embedding_model} does not support reduced dimensions")
+
+    if args.mode == "truncate" and source_dims and any(d >= source_dims for d in sizes):
+        raise SystemExit(f"{args.source} holds {source_dims}-d vectors; truncate can only go smaller")
+
+    if not args.bench_only:
+        for dims in sizes:
+            await copy_collection(svc, args.source, dims, args.mode, args.batch_size, args.replace)
+
+    queries = load_warmup_queries(args.queries, args.limit)
+    if not queries:
+        print("no --queries given; skipping the benchmark")
+        return
+    # Embed once at the source size; shortened copies of those vectors equal the API's `dimensions` output
+    full = await svc._embed_many(queries, source_dims)
+
+    rows = [("full", await bench_collection(src, full, args.k, args.runs))]
+    for dims in sizes:
+        col = await svc.get_chroma_collection(target_name(args.source, dims), dimensions=dims)
+        vectors = [reduce_embedding(v, dims) for v in full]
+        rows.append((target_name(args.source, dims), await bench_collection(col, vectors, args.k, args.runs)))
+
+    truth = rows[0][1]["ids"]
+    print(f"\n{len(queries)} queries x {args.runs} runs, k={args.k}")
+    print(f"{'collection':<28}{'dims':>6}{'vectors':>9}{'vec MiB':>9}{'index MiB':>11}"
+          f"{'query B':>9}{'p50 ms':>8}{'p99 ms':>8}{f'recall@{args.k}':>11}")
+    for name, r in rows:
+        print(f"{name:<28}{r['dims']:>6}{r['count']:>9}{r['vector_mib']:>9.1f}{r['index_mib']:>11.1f}"
+              f"{r['payload_bytes']:>9.0f}{r['p50_ms']:>8.1f}{r['p99_ms']:>8.1f}"
+              f"{recall_at_k(truth, r['ids'], args.k):>11.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", default="financeilm", help="full-size collection to copy")
+    parser.add_argument("--dimensions", required=True, help="comma-separated target sizes, e.g. 256,512,1024")
+    parser.add_argument("--mode", choices=("truncate", "reembed"), default="truncate")
+    parser.add_argument("--queries", help="file with one benchmark question per line")
+    parser.add_argument("--limit", type=int, default=200, help="max benchmark questions")
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--runs", type=int, default=3, help="passes over the questions for latency")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--bench-only", action="store_true", help="skip copying; benchmark existing copies")
+    parser.add_argument("--replace", action="store_true", help="drop existing copies before rebuilding")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+from src.config import get_tokenizer
+from src.services import logservice
+from src.services.chromaservice import get_chroma_service
+from src.services.rerankservice import MMRReranker
+from src.config import exit_text
+import requests
+import numpy as np
+from src.services import openaiservice
+
+# OpenAI accepts at most 2048 inputs per embeddings request
+EMBEDDING_BATCH_LIMIT = 2048
+
+class FinanceILM():
+    def __init__(self) -> None:
+        # Diversifies the top-8 and drops near-duplicate chunks before they reach the prompt
+        self.reranker = MMRReranker(k=8)
+
+    def tiktoken_len(self,text:str) ->int:
+        tokens = get_tokenizer().encode(
+            text,
+            disallowed_special=()
+        )
+        return len(tokens)
+    
+
+
+    async def embed_questions(self, questions: list[str]) -> list[list[float]]:
+        """
+        Embeds many questions with batched embedding requests (one request per 2048 inputs).
+
+        Args:
+            questions (list[str]): The questions to embed.
+
+        Returns:
+            list: One embedding per question, in input order.
+        """
+        chromasvc = get_chroma_service()
+        # embed at the size the retrieval collection was built with
+        dimensions = await chromasvc.get_collection_dimensions(chromasvc.retrieval_collection)
+        embeddings = []
+        for start in range(0, len(questions), EMBEDDING_BATCH_LIMIT):
+            batch = questions[start:start + EMBEDDING_BATCH_LIMIT]
+            embeddings.extend(await chromasvc._embed_many(batch, dimensions))
+        return embeddings
+
+    async def get_context(self, question: str, source: str, query_embedding: list[float] | None = None):
+        """
+        Retrieves context from the Chroma pipeline.
+
+        Args:
+            question (str): The question to be sent.
+            source (str): The source for the context.
+            query_embedding (list[float], optional): Precomputed embedding of the question.
+
+        Returns:
+            tuple: (text, link_extracted, mean score, chunks), where chunks lists the
+                {"id", "score"} of each retrieved chunk, or all None if an error occurs.
+                Chunks of a lexical-only answer have no distance: their score is None and
+                they carry "retrieval": "lexical" and "bm25_ratio" (their BM25 score over the
+                query's maximum, 0..1); the mean score is None if no chunk has one.
+        """
+        logservice.logging.info("Starting get_context function to retrieve context from the Chroma pipeline.")
+        chromasvc = get_chroma_service()
+        try:
+            print("question",question)
+            text_l, link_extracted, score_l, chunk_ids, strength_l = await chromasvc.get_context_info_optimized(
+                question, source, reranker=self.reranker, query_embedding=query_embedding
+            )
+            
+        except requests.exceptions.HTTPError as http_err:
+            logservice.logging.error("HTTP error occurred: %s", http_err)
+            return None, None, None, None
+        except requests.exceptions.RequestException as req_err:
+            logservice.logging.error("Request exception occurred: %s", req_err)
+            return None, None, None, None
+        except Exception as err:
+            logservice.logging.error("An unexpected error occurred: %s", err)
+            return None, None, None, None
+        else:
+            try:
+                text = '\n\n'.join(text_l)
+                distances = [s for s in score_l if s is not None]
+                score = float(np.mean(distances)) if distances else (None if score_l else 0)
+                chunks = [
+                    {"id": cid, "score": float(s)} if s is not None
+                    else {"id": cid, "score": None, "retrieval": "lexical", "bm25_ratio": r}
+                    for cid, s, r in zip(chunk_ids, score_l, strength_l)
+                ]
+                logservice.logging.info("Context received successfully.")
+                return text, link_extracted, score, chunks
+            except ValueError as json_err:
+                logservice.logging.error("Error parsing JSON response: %s", json_err)
+                return None, None, None, None
+
+
+    def format_last_queries(self, data):
+        """
+        Extracts and formats the last four question-answer pairs from a dictionary.
+
+        Args:
+            data (dict): A dictionary containing a "queries" key with a list of question-answer pairs.
+
+        Returns:
+            str: A formatted string containing the last four (or fewer) question-answer pairs.
+                Each pair is formatted as:
+
+                Question: <Question>
+                Answer: <Answer>
+        """
+        try:
+            # Extract the list of queries
+            queries = data.get("queries", [])
+            
+            # Ensure 'queries' is a list
+            if not isinstance(queries, list):
+                raise TypeError("'queries' should be a list.")
+            
+            # Determine how many queries to extract (max 4)
+            num_queries = min(len(queries), 4)
+            
+            # Get the last `num_queries` pairs
+            last_queries = queries[-num_queries:]
+            
+            # Format them into the required form
+            formatted_output = ""
+            for query in last_queries:
+                try:
+                    question = query['Question']
+                    answer = query['Answer']
+                    formatted_output += f"Question: {question}\nAnswer: {answer}\n"
+                except KeyError as e:
+                    logservice.logging.error("Missing expected key in query: %s", e)
+                    continue  # Skip this query and proceed to the next one
+            
+            logservice.logging.info("Successfully formatted last queries.")
+            return formatted_output.strip()
+        
+        except TypeError as type_err:
+            logservice.logging.error("Type error occurred: %s", type_err)
+        except Exception as ex:
+            logservice.logging.error("An unexpected error occurred: %s", ex)
+        
+        return ""
+        
+                
+
+    def rephrase_query(self, data_input, question, flag: int = 0) -> str:
+        """
+        Rephrases a follow-up question into a standalone question for FinanceILM.
+
+        Args:
+            data_input (dict): Conversation history data.
+            question (str): The recent user question to be rephrased.
+            flag (int, optional): Reserved/unused flag. Defaults to 0.
+
+        Returns:
+            str: The rephrased standalone question, or an empty string if an error occurs.
+        """
+        try:
+            previous_query_str = self.format_last_queries(data_input) or ""
+            logservice.logging.debug("Formatted previous conversations successfully.")
+
+            # Domain-focused, strict output, no hallucinations
+            prompt_rephrase = (
+                "You are a FinanceILM assistant that REPHRASES follow-up questions into a single, "
+                "clear, standalone question specifically about ISLAMIC FINANCE topics (e.g., Shariah-compliant "
+                "products, contracts, screens, regulatory/compliance rules, AAOIFI/IFSB guidance, local "
+                "jurisdictional regulations, sukuk, takaful, murabaha, ijara, mudaraba, musharaka, etc.).\n\n"
+                "Requirements:\n"
+                "- Do NOT add new facts. Do NOT infer details that aren't present.\n"
+                "- Resolve pronouns like 'it/that/this' using the chat history when possible.\n"
+                "- Keep any mentioned entity names, instruments, jurisdictions, dates, currencies, and thresholds.\n"
+                "- Prefer neutral, compliance-aware phrasing. If the follow-up is ambiguous, keep it conservative but standalone.\n"
+                "- Output ONLY the rephrased question text. No labels, no quotes, no explanations.\n\n"
+                "Examples (illustrative):\n"
+                "User context: 'Compare murabaha vs ijara for asset financing in KSA.'\n"
+                "Follow-up: 'Which one fits leasing better?'\n"
+                "Rephrased: 'Which contract fits leasing better in Saudi Arabia, murabaha or ijara?'\n"
+                "----\n"
+                "User context: 'AAOIFI screening ratios for equities.'\n"
+                "Follow-up: 'What about thresholds for cash and receivables?'\n"
+                "Rephrased: 'What are the AAOIFI equity screening thresholds for cash and receivables?'\n"
+                "----\n"
+                "User context: 'Takaful vs conventional insurance regulatory differences in Malaysia.'\n"
+                "Follow-up: 'And disclosures?'\n"
+                "Rephrased: 'What disclosure requirements differentiate takaful from conventional insurance in Malaysia?'\n"
+            )
+
+            response = openaiservice.chat_create(
+                model="gpt-4o-mini",
+                messages=[
+                    {"role": "system", "content": prompt_rephrase},
+                    {"role": "user", "content": f"Chat history:\n{previous_query_str}"},
+                    {"role": "user", "content": f"Follow-up to rephrase:\n{question}\n\nReturn ONLY the standalone question."},
+                ],
+                max_tokens=80,
+                temperature=0.0,
+            )
+
+            # Defensive parsing
+            content = ""
+            if hasattr(response, "choices") and response.choices:
+                msg = getattr(response.choices[0], "message", None)
+                if msg and hasattr(msg, "content") and msg.content:
+                    content = msg.content.strip()
+
+            if not content:
+                # If the model returned nothing, keep behavior predictable
+                logservice.logging.warning("Empty content received for rephrased query; returning empty string.")
+                return ""
+
+            # Strip any accidental prefixes the model might add
+            cleaned = (
+                content.replace("Rephrased:", "")
+                    .replace("REPHRASED:", "")
+                    .replace("Rephrased Query:", "")
+                    .replace("Standalone Query:", "")
+                    .strip(" \n:‘’\"")
+                    .strip()
+            )
+
+            logservice.logging.info("Received rephrased query successfully.")
+            print("REPHRASED Query:", cleaned)  # Optional: keep for local debugging
+
+            return cleaned
+
+        except Exception as e:
+            logservice.logging.error("An error occurred while rephrasing the query: %s", e)
+            return ""
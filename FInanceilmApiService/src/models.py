@@ -0,0 +1,34 @@
+from typing import Literal
+from pydantic import BaseModel, Field
+
+class Context(BaseModel):
+    text: str
+    link_extracted: dict
+
+# v1 API
+class StreamChunk(BaseModel):
+    text: str | None
+    usage: dict | None
+
+class Message(BaseModel):
+    role: str
+    content: str
+
+class QuestionInput(BaseModel):
+    messages: list[Message] = [] # message history
+    stream: bool = False
+    referrer: str = "site"
+    stream_protocol: Literal["legacy", "events"] = "legacy" # see src/services/streamservice.py
+    context_mode: Literal["inline", "reference"] = "inline" # see src/services/contextstore.py
+    # session mode (see src/services/sessionservice.py): send `messages` once to seed the
+    # session, then only the new `message` on each turn
+    session_id: str | None = Field(default=None, min_length=1, max_length=128)
+    message: Message | None = None
+
+class BatchInput(BaseModel):
+    items: list[QuestionInput] = []
+    concurrency: int | None = None # defaults to BATCH_CONCURRENCY
+
+class UserFacingException(Exception):
+    def __init__(self, message: str = "Sorry there was an issue. Please refresh and try again."):
+        self.message = message
\ No newline at end of file
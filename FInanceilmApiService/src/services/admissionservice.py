@@ -0,0 +1,278 @@
+# src/services/admissionservice.py
+
+import asyncio
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src.config import completion_kwargs, get_tokenizer
+from src.services import logservice
+from src.services.metricsservice import metrics
+
+# Rough size of the retrieved context we add to every prompt (not known before retrieval)
+CONTEXT_TOKENS_ESTIMATE = int(os.getenv("ADMISSION_CONTEXT_TOKENS_ESTIMATE", "2000"))
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries the suggested Retry-After in seconds."""
+
+    def __init__(self, reason: str, retry_after: float) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Budgets estimated LLM tokens per minute. Refills continuously at tokens_per_minute / 60.
+    """
+
+    def __init__(self, tokens_per_minute: int) -> None:
+        self.capacity = float(tokens_per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = self.capacity
+        self._last = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_take(self, amount: float) -> float:
+        """
+        Takes `amount` tokens if available and returns 0, otherwise returns the seconds
+        until they would be available (nothing is taken).
+        """
+        amount = min(amount, self.capacity)
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Returns tokens to the bucket; a negative amount takes more (the bucket may go into debt)."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def usage_tokens(usage: Any) -> Optional[int]:
+    """Total tokens of an OpenAI usage object or dict (None when unknown)."""
+    if usage is None:
+        return None
+    if isinstance(usage, dict):
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+    else:
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    return prompt_tokens + completion_tokens
+
+
+class Ticket:
+    """
+    An admitted request. release() is idempotent and safe to call from worker threads.
+    Report the completion's usage with record_usage() before releasing: the token bucket
+    is then corrected from the estimate to what the request actually consumed.
+    """
+
+    def __init__(self, controller: "AdmissionController", token: str, estimated_tokens: float) -> None:
+        self._controller = controller
+        self.token = token
+        self.estimated_tokens = estimated_tokens
+        self.actual_tokens: Optional[int] = None
+        self._released = False
+
+    def record_usage(self, usage: Any) -> None:
+        tokens = usage_tokens(usage)
+        if tokens is not None:
+            self.actual_tokens = tokens
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        self._controller._release_threadsafe(self)
+
+
+class AdmissionController:
+    """
+    Admission control in front of the LLM routes.
+
+    - Global and per-bearer-token concurrency limits on admitted requests.
+    - Bounded FIFO wait queue with a maximum queue time. A request over either limit waits
+      there; a released slot goes to the oldest waiter whose token is under its limit.
+    - Token bucket budgeting LLM tokens per minute against the OpenAI quota: the estimate
+      is taken on admission and corrected with the real usage on release.
+    When capacity is exhausted, acquire() fails fast with AdmissionRejected instead of
+    letting the request reach OpenAI and come back as a RateLimitError.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        per_token_concurrency: int,
+        max_queue: int,
+        max_queue_wait_s: float,
+        tokens_per_minute: int,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.per_token_concurrency = per_token_concurrency
+        self.max_queue = max_queue
+        self.max_queue_wait_s = max_queue_wait_s
+        self.bucket: Optional[TokenBucket] = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+
+        self._active = 0
+        self._per_token: Dict[str, int] = defaultdict(int)
+        self._waiters: Deque[Tuple[asyncio.Future, str]] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        max_concurrency = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "64"))
+        return cls(
+            max_concurrency=max_concurrency,
+            # one bearer token is configured today, so by default it may use every slot
+            per_token_concurrency=int(os.getenv("ADMISSION_PER_TOKEN_CONCURRENCY", str(max_concurrency))),
+            max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "128")),
+            max_queue_wait_s=float(os.getenv("ADMISSION_MAX_QUEUE_WAIT_S", "5")),
+            tokens_per_minute=int(os.getenv("OPENAI_TPM_BUDGET", "200000")),
+        )
+
+    # ---------- metrics ----------
+
+    def _export(self) -> None:
+        metrics.set_gauge("admission.in_flight", self._active)
+        metrics.set_gauge("admission.queue_depth", len(self._waiters))
+
+    def _reject(self, estimated_tokens: float, reason: str, retry_after: float, refund: bool) -> None:
+        if refund and self.bucket is not None:
+            self.bucket.refund(estimated_tokens)
+        metrics.incr(f"admission.rejected.{reason}")
+        self._export()
+        logservice.logging.warning("Admission rejected (%s), retry after %.1fs.", reason, retry_after)
+        raise AdmissionRejected(reason, retry_after)
+
+    # ---------- slots ----------
+
+    def _can_run(self, token: str) -> bool:
+        return self._active < self.max_concurrency and self._per_token.get(token, 0) < self.per_token_concurrency
+
+    def _take_slot(self, token: str) -> None:
+        self._active += 1
+        self._per_token[token] += 1
+
+    def _free_slot(self, token: str) -> None:
+        self._active -= 1
+        self._per_token[token] -= 1
+        if self._per_token[token] <= 0:
+            del self._per_token[token]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hands free slots to the oldest waiters that fit (the slot is taken on their behalf)."""
+        for entry in list(self._waiters):
+            if self._active >= self.max_concurrency:
+                break
+            fut, token = entry
+            if fut.done():
+                self._waiters.remove(entry)
+            elif self._can_run(token):
+                self._waiters.remove(entry)
+                self._take_slot(token)
+                fut.set_result(None)
+
+    # ---------- acquire / release ----------
+
+    async def acquire(self, token: str, estimated_tokens: float) -> Ticket:
+        self._loop = asyncio.get_running_loop()
+
+        if self.bucket is not None:
+            wait = self.bucket.try_take(estimated_tokens)
+            if wait > 0:
+                self._reject(estimated_tokens, "token_budget", wait, refund=False)
+
+        # waiters left in the queue never fit (every release dispatches), so no one is skipped
+        if self._can_run(token):
+            self._take_slot(token)
+            metrics.incr("admission.admitted")
+            metrics.observe("admission.queue_wait_s", 0.0)
+            self._export()
+            return Ticket(self, token, estimated_tokens)
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject(estimated_tokens, "queue_full", self.max_queue_wait_s, refund=True)
+
+        fut = self._loop.create_future()
+        entry = (fut, token)
+        self._waiters.append(entry)
+        self._export()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout=self.max_queue_wait_s)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if fut.done() and not fut.cancelled():
+                # handed a slot just as we gave up: pass it on
+                self._free_slot(token)
+            else:
+                fut.cancel()
+                if entry in self._waiters:
+                    self._waiters.remove(entry)
+            if isinstance(e, asyncio.TimeoutError):
+                self._reject(estimated_tokens, "queue_timeout", self.max_queue_wait_s, refund=True)
+            if self.bucket is not None:
+                self.bucket.refund(estimated_tokens)
+            self._export()
+            raise
+
+        metrics.incr("admission.admitted")
+        metrics.observe("admission.queue_wait_s", time.monotonic() - started)
+        self._export()
+        return Ticket(self, token, estimated_tokens)
+
+    def _release(self, ticket: Ticket) -> None:
+        if self.bucket is not None and ticket.actual_tokens is not None:
+            # settle the estimate; a request that used more than estimated owes the difference
+            difference = ticket.estimated_tokens - ticket.actual_tokens
+            self.bucket.refund(difference)
+            metrics.incr("admission.tokens_refunded", difference)
+        self._free_slot(ticket.token)
+        self._export()
+
+    def _release_threadsafe(self, ticket: Ticket) -> None:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self._loop is not None and running is not self._loop:
+            self._loop.call_soon_threadsafe(self._release, ticket)
+        else:
+            self._release(ticket)
+
+    @asynccontextmanager
+    async def admit(self, token: str, estimated_tokens: float):
+        ticket = await self.acquire(token, estimated_tokens)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+
+def estimate_request_tokens(messages: List[Any], prompt_tokens: Optional[int] = None) -> int:
+    """
+    Estimates the LLM tokens a request will consume: the history we actually send
+    (last 4 messages), an allowance for the retrieved context, and max_tokens.
+    Pass prompt_tokens when the history's token count is already known (server-side sessions).
+    """
+    if prompt_tokens is None:
+        tokenizer = get_tokenizer()
+        prompt_tokens = 0
+        for m in messages[-4:]:
+            content = m.content if hasattr(m, "content") else m.get("content", "")
+            prompt_tokens += len(tokenizer.encode(content or "", disallowed_special=()))
+    return prompt_tokens + CONTEXT_TOKENS_ESTIMATE + completion_kwargs["max_tokens"]
+
+
+admission = AdmissionController.from_env()
@@ -0,0 +1,420 @@
+# src/services/cacheservice.py
+
+import asyncio
+import json
+import os
+import sqlite3
+import stat
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from src.services import logservice
+from src.services.executorservice import blocking
+from src.services.metricsservice import metrics
+
+# Sentinel for "not cached" (None is a legitimate cached value)
+MISSING = object()
+
+# SQLite value encodings (first byte of the blob): float vectors as packed float32, the rest as JSON
+_FLOAT32 = b"f"
+_JSON = b"j"
+
+
+def encode_value(value: Any) -> bytes:
+    """Serializes a cache value without pickle: embeddings as float32 bytes, anything else as JSON."""
+    if isinstance(value, (list, tuple)) and value and all(type(v) is float for v in value):
+        return _FLOAT32 + array("f", value).tobytes()
+    return _JSON + json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def decode_value(blob: bytes) -> Any:
+    """Inverse of encode_value; raises ValueError for anything else (e.g. rows in an old format)."""
+    tag, body = bytes(blob[:1]), bytes(blob[1:])
+    if tag == _FLOAT32:
+        values = array("f")
+        values.frombytes(body)
+        return values.tolist()
+    if tag == _JSON:
+        return json.loads(body.decode("utf-8"))
+    raise ValueError("unknown cache value encoding")
+
+
+def default_cache_path() -> str:
+    """~/.cache/financeilm/cache.sqlite3 (or under $XDG_CACHE_HOME): a per-user directory."""
+    base = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "financeilm", "cache.sqlite3")
+
+
+def _check_private(path: str, kind: str) -> None:
+    st = os.stat(path)
+    if st.st_uid != os.getuid():
+        raise PermissionError(f"cache {kind} {path} is not owned by this user")
+    if st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise PermissionError(f"cache {kind} {path} is writable by other users")
+
+
+def prepare_cache_path(path: str) -> None:
+    """
+    Creates the cache file's directory (0700) and the file itself (0600), and refuses a
+    directory or file that other users could write to or replace.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):
+        return  # no POSIX ownership to check
+    _check_private(directory, "directory")
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    os.close(fd)
+    _check_private(path, "file")
+
+
+class CacheBackend(ABC):
+    """
+    Minimal cache interface shared by the local and host-shared backends.
+
+    - get/set with a per-entry TTL (seconds) and a size bound per namespace.
+    - get_or_compute: computes a missing value once, even with concurrent callers.
+    - a* variants for the event loop: backends that do I/O (does_io) run on the blocking executor.
+    """
+
+    # True when get/set touch disk; async callers then hop to the blocking executor
+    does_io = False
+
+    def __init__(self, namespace: str, max_entries: int, ttl: float) -> None:
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        """Returns the cached value, or MISSING."""
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        """Stores a value for ttl seconds (the backend's default when None)."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Removes a key if present."""
+
+    @abstractmethod
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        """Returns the cached value, computing and storing it once if missing."""
+
+    @abstractmethod
+    async def aget_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[Any]], ttl: Optional[float] = None
+    ) -> Any:
+        """get_or_compute for a coroutine function."""
+
+    def _get_many(self, keys: Iterable[str]) -> List[Any]:
+        return [self.get(k) for k in keys]
+
+    def _set_many(self, items: Iterable[Tuple[str, Any]], ttl: Optional[float] = None) -> None:
+        for key, value in items:
+            self.set(key, value, ttl)
+
+    async def aget(self, key: str) -> Any:
+        return await blocking.run(self.get, key) if self.does_io else self.get(key)
+
+    async def aset(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        if self.does_io:
+            await blocking.run(self.set, key, value, ttl)
+        else:
+            self.set(key, value, ttl)
+
+    async def aget_many(self, keys: List[str]) -> List[Any]:
+        if self.does_io:
+            return await blocking.run(self._get_many, keys)
+        return self._get_many(keys)
+
+    async def aset_many(self, items: List[Tuple[str, Any]], ttl: Optional[float] = None) -> None:
+        if self.does_io:
+            await blocking.run(self._set_many, items, ttl)
+        else:
+            self._set_many(items, ttl)
+
+    def _record(self, hit: bool) -> None:
+        metrics.incr(f"cache.{self.namespace}.{'hits' if hit else 'misses'}")
+
+
+class LocalCache(CacheBackend):
+    """In-process LRU + TTL cache. Each worker process has its own copy."""
+
+    def __init__(self, namespace: str, max_entries: int = 4096, ttl: float = 3600.0) -> None:
+        super().__init__(namespace, max_entries, ttl)
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= time.time():
+                if item is not None:
+                    del self._data[key]
+                self._record(False)
+                return MISSING
+            self._data.move_to_end(key)
+            self._record(True)
+            return item[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (time.time() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            value = self.get(key)
+            if value is MISSING:
+                value = compute()
+                self.set(key, value, ttl)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return value
+
+    async def aget_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[Any]], ttl: Optional[float] = None
+    ) -> Any:
+        value = self.get(key)
+        if value is not MISSING:
+            return value
+        pending = self._pending.get(key)
+        if pending is not None:
+            try:
+                return await asyncio.shield(pending)
+            except Exception:
+                pass  # the first caller failed; try ourselves
+        pending = asyncio.get_running_loop().create_future()
+        self._pending[key] = pending
+        try:
+            value = await compute()
+            self.set(key, value, ttl)
+            pending.set_result(value)
+            return value
+        except BaseException as e:
+            pending.set_exception(e if isinstance(e, Exception) else RuntimeError("cancelled"))
+            pending.exception()  # mark retrieved: waiters may be gone
+            raise
+        finally:
+            if self._pending.get(key) is pending:
+                del self._pending[key]
+
+
+class SQLiteCache(CacheBackend):
+    """
+    Host-shared cache in a SQLite file (WAL mode), shared by every worker process on the host.
+
+    - Values are stored as JSON or packed float32 vectors (encode_value), never pickled:
+      reading the file can't execute code. Expired rows are ignored and purged during eviction.
+    - The file lives in a private directory (prepare_cache_path refuses shared locations).
+    - Eviction keeps at most max_entries per namespace, least recently used first. A hit
+      only rewrites accessed_at once it is older than touch_interval (default ttl/10), so
+      reads rarely take the WAL write lock shared by every worker on the host.
+    - get_or_compute takes a row lock in a `locks` table so only one process computes a key;
+      the others poll until the value lands or the lock expires.
+    """
+
+    does_io = True
+
+    def __init__(
+        self,
+        namespace: str,
+        path: str,
+        max_entries: int = 100_000,
+        ttl: float = 3600.0,
+        lock_timeout: float = 30.0,
+        touch_interval: Optional[float] = None,
+    ) -> None:
+        super().__init__(namespace, max_entries, ttl)
+        self.path = path
+        self.lock_timeout = lock_timeout
+        self.touch_interval = ttl / 10 if touch_interval is None else touch_interval
+        self._local = threading.local()
+        self._writes = 0
+        prepare_cache_path(path)
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " ns TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,"
+                " expires_at REAL NOT NULL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (ns, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (ns, accessed_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS locks ("
+                " ns TEXT NOT NULL, key TEXT NOT NULL, owner TEXT NOT NULL, expires_at REAL NOT NULL,"
+                " PRIMARY KEY (ns, key))"
+            )
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads; keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Any:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, accessed_at FROM cache WHERE ns = ? AND key = ? AND expires_at > ?",
+            (self.namespace, key, now),
+        ).fetchone()
+        if row is None:
+            self._record(False)
+            return MISSING
+        try:
+            value = decode_value(row[0])
+        except ValueError:
+            self.delete(key)  # unreadable (older format): treat as a miss
+            self._record(False)
+            return MISSING
+        if now - row[1] >= self.touch_interval:
+            # LRU order only needs to be roughly right: most hits stay read-only
+            conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE ns = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+        self._record(True)
+        return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache (ns, key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (self.namespace, key, encode_value(value), now + (ttl or self.ttl), now),
+        )
+        self._writes += 1
+        # amortize eviction instead of counting rows on every write
+        if self._writes % 64 == 0:
+            self.evict()
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM cache WHERE ns = ? AND key = ?", (self.namespace, key))
+
+    def evict(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM cache WHERE ns = ? AND expires_at <= ?", (self.namespace, time.time()))
+            conn.execute(
+                "DELETE FROM cache WHERE ns = ? AND key IN ("
+                " SELECT key FROM cache WHERE ns = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_entries),
+            )
+
+    def _try_lock(self, key: str, owner: str) -> bool:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM locks WHERE ns = ? AND key = ? AND expires_at <= ?", (self.namespace, key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO locks (ns, key, owner, expires_at) VALUES (?, ?, ?, ?)",
+                (self.namespace, key, owner, now + self.lock_timeout),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount == 1
+
+    def _unlock(self, key: str, owner: str) -> None:
+        self._conn().execute("DELETE FROM locks WHERE ns = ? AND key = ? AND owner = ?", (self.namespace, key, owner))
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: Optional[float] = None) -> Any:
+        owner = uuid.uuid4().hex
+        deadline = time.time() + self.lock_timeout
+        while True:
+            value = self.get(key)
+            if value is not MISSING:
+                return value
+            if self._try_lock(key, owner):
+                try:
+                    # another process may have finished between our get and the lock
+                    value = self.get(key)
+                    if value is MISSING:
+                        value = compute()
+                        self.set(key, value, ttl)
+                    return value
+                finally:
+                    self._unlock(key, owner)
+            if time.time() >= deadline:
+                logservice.logging.warning("cacheservice: lock wait timed out for %s/%s; computing locally.", self.namespace, key)
+                return compute()
+            time.sleep(0.05)
+
+    async def aget_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[Any]], ttl: Optional[float] = None
+    ) -> Any:
+        """get_or_compute for coroutines: SQLite work runs on the blocking executor, waits don't block."""
+        owner = uuid.uuid4().hex
+        deadline = time.time() + self.lock_timeout
+        while True:
+            value = await blocking.run(self.get, key)
+            if value is not MISSING:
+                return value
+            if await blocking.run(self._try_lock, key, owner):
+                try:
+                    value = await blocking.run(self.get, key)
+                    if value is MISSING:
+                        value = await compute()
+                        await blocking.run(self.set, key, value, ttl)
+                    return value
+                finally:
+                    await blocking.run(self._unlock, key, owner)
+            if time.time() >= deadline:
+                logservice.logging.warning("cacheservice: lock wait timed out for %s/%s; computing locally.", self.namespace, key)
+                return await compute()
+            await asyncio.sleep(0.05)
+
+
+_caches: Dict[str, CacheBackend] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(namespace: str, max_entries: int = 4096, ttl: float = 3600.0,
+              backend: Optional[str] = None) -> CacheBackend:
+    """
+    Returns the cache for a namespace, using `backend` or, when it is None, the one
+    selected by CACHE_BACKEND:
+      local  - per-process LRU (default)
+      sqlite - host-shared SQLite file at CACHE_PATH (default: default_cache_path()),
+               shared by all workers of the same user on the host
+    Namespaces whose entries must be visible to every worker (e.g. stored contexts) pass
+    backend="sqlite"; plain caches follow CACHE_BACKEND.
+    """
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            backend = (backend or os.getenv("CACHE_BACKEND", "local")).lower()
+            if backend == "sqlite":
+                path = os.getenv("CACHE_PATH") or default_cache_path()
+                cache = SQLiteCache(namespace, path, max_entries=max_entries, ttl=ttl)
+            else:
+                cache = LocalCache(namespace, max_entries=max_entries, ttl=ttl)
+            _caches[namespace] = cache
+        return cache
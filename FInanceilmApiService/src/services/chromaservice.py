@@ -0,0 +1,598 @@
+# src/services/chromaservice.py
+
+import os
+import asyncio
+import hashlib
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Prefer your project's logservice; fall back to stdlib logging if unavailable
+try:
+    from src.services import logservice  # expects logservice.logging
+except Exception:  # pragma: no cover
+    import logging as _fallback_logging
+    class _LogSvc:  # minimal shim
+        logging = _fallback_logging
+    logservice = _LogSvc()
+
+# chromadb and openai are imported inside ChromaService: both are slow to import and
+# only needed once the first request (or the startup warm-up) builds the service.
+from src.services.retryservice import upstream
+from src.services.cacheservice import MISSING, get_cache
+from src.services.executorservice import blocking
+from src.services.lexicalservice import LEXICAL_FETCH_K, lexical, rrf_fuse
+from src.services.metricsservice import metrics
+
+load_dotenv()
+
+# text-embedding-3-* vectors can be shortened: the API's `dimensions` parameter returns the
+# same vector as truncating the full one and re-normalizing it to unit length.
+SHORTENABLE_EMBEDDING_MODELS = ("text-embedding-3-small", "text-embedding-3-large")
+
+# Collection metadata keys recording how a collection's vectors were produced
+META_EMBEDDING_MODEL = "embedding_model"
+META_EMBEDDING_DIMENSIONS = "embedding_dimensions"
+
+
+class EmbeddingDimensionMismatch(ValueError):
+    """A vector or configuration doesn't match the dimensions recorded on a collection."""
+
+
+def parse_collection_dimensions(value: Optional[str]) -> Dict[str, int]:
+    """Parses COLLECTION_EMBEDDING_DIMENSIONS, e.g. "financeilm_d512=512,financeilm=1536"."""
+    out: Dict[str, int] = {}
+    for part in (value or "").split(","):
+        if "=" in part:
+            name, dims = part.split("=", 1)
+            out[name.strip()] = int(dims)
+    return out
+
+
+def reduce_embedding(vector: Any, dimensions: int) -> List[float]:
+    """Shortens a text-embedding-3 vector to `dimensions` (truncate, then L2-normalize)."""
+    import numpy as np
+
+    v = np.asarray(vector, dtype=np.float32)[:dimensions]
+    norm = float(np.linalg.norm(v))
+    return (v / norm if norm > 0 else v).tolist()
+
+
+
+class ChromaService:
+    """
+    ChromaDB 1.0.15/1.0.16 service
+
+    - Uses **client-side** embeddings for all queries/writes to avoid server default/size mismatches.
+    - Never changes a collection's persisted embedding_function (prevents conflicts).
+    - Chroma and OpenAI are called through their async HTTP clients: a waiting request holds
+      no thread, and one client (one keep-alive pool) is shared by every request in the worker.
+    - The remaining blocking work (SQLite cache, reranking) runs on the blocking executor.
+    - Returns lists of (text, distance, metadata).
+    - embeddings=False skips the OpenAI client (and its API key) for callers that only pass
+      precomputed query embeddings, e.g. scripts/eval_retrieval.py run.
+    """
+
+    def __init__(self, embeddings: bool = True) -> None:
+        from openai import AsyncOpenAI
+
+        self.chroma_host = os.getenv("CHROMA_HOST", "localhost")
+        # Make sure this matches your server (your logs showed 8007)
+        self.chroma_port = int(os.getenv("CHROMA_PORT", "8007"))
+        self.default_k = int(os.getenv("DEFAULT_K", "6"))
+        # Chunks put in the prompt by get_context_info_optimized when no reranker is used
+        self.context_k = int(os.getenv("CONTEXT_K", "8"))
+
+        # OpenAI API key (supports either OPENAI_API_KEY or ALIM_API_KEY)
+        openai_key = os.getenv("OPENAI_API_KEY") or os.getenv("ALIM_API_KEY")
+        self._openai: Optional[Any] = None
+        if embeddings:
+            if not openai_key:
+                logservice.logging.error("chromaservice.py: Missing OPENAI_API_KEY.")
+                raise RuntimeError("Missing OPENAI_API_KEY/ALIM_API_KEY.")
+            # Retries/pacing are handled by the shared upstream scheduler
+            self._openai = AsyncOpenAI(api_key=openai_key, max_retries=0)
+
+        # IMPORTANT: set this to the SAME model you used when inserting documents
+        # text-embedding-3-small and ada-002 are both 1536-d; MiniLM/SBERT are often 384-d.
+        self.embedding_model = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+
+        # Per-collection embedding size (unset = the model's native size). Recorded in the
+        # collection metadata on creation and checked against it whenever a collection is opened.
+        self.collection_dimensions = parse_collection_dimensions(os.getenv("COLLECTION_EMBEDDING_DIMENSIONS"))
+        # Collection answering get_context_info_optimized (e.g. a reduced-dimension copy)
+        self.retrieval_collection = os.getenv("RETRIEVAL_COLLECTION", "financeilm")
+
+        # Query/document embeddings are deterministic per (model, text): cache them.
+        # With CACHE_BACKEND=sqlite the cache is shared by every worker on the host.
+        self._embedding_cache = get_cache(
+            "embeddings",
+            max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000")),
+            ttl=float(os.getenv("EMBEDDING_CACHE_TTL_S", str(7 * 24 * 3600))),
+        )
+
+        # The async Chroma client is created on first use (its factory is a coroutine)
+        self._chroma_client: Optional[Any] = None
+        self._client_lock = asyncio.Lock()
+        self._collections: Dict[str, Any] = {}
+        self._dimensions: Dict[str, Optional[int]] = {}
+
+    # ---------- collection helpers ----------
+
+    async def get_chroma_client(self) -> Any:
+        """Process-wide chromadb AsyncHttpClient with token auth (adjust envs if needed)."""
+        if self._chroma_client is None:
+            async with self._client_lock:
+                if self._chroma_client is None:
+                    from chromadb import AsyncHttpClient
+                    from chromadb.config import Settings
+
+                    self._chroma_client = await AsyncHttpClient(
+                        host=self.chroma_host,
+                        port=self.chroma_port,
+                        settings=Settings(
+                            chroma_client_auth_provider="chromadb.auth.token_authn.TokenAuthClientProvider",
+                            chroma_client_auth_credentials=os.getenv("CHROMA_AUTH_TOKEN"),
+                            chroma_auth_token_transport_header=os.getenv("CHROMA_AUTH_TOKEN_HEADER", "X-Chroma-Token"),
+                        ),
+                    )
+        return self._chroma_client
+
+    async def get_chroma_collection(self, collection_name: str, dimensions: Optional[int] = None) -> Any:
+        """
+        Get existing collection; if missing, create one **without** server-side embedding_function.
+        We keep everything client-side for consistency (no dimension surprises).
+        New collections record the embedding model and dimensions in their metadata; opening one
+        whose recorded model/dimensions differ from the configured ones raises EmbeddingDimensionMismatch.
+        Handles are cached per process.
+        """
+        col = self._collections.get(collection_name)
+        if col is None:
+            from chromadb.errors import NotFoundError
+
+            dimensions = dimensions or self.collection_dimensions.get(collection_name)
+            if dimensions and self.embedding_model not in SHORTENABLE_EMBEDDING_MODELS:
+                raise EmbeddingDimensionMismatch(f"{self.embedding_model} does not support custom dimensions.")
+
+            client = await self.get_chroma_client()
+            try:
+                col = await client.get_collection(name=collection_name)
+            except NotFoundError:
+                metadata: Dict[str, Any] = {META_EMBEDDING_MODEL: self.embedding_model}
+                if dimensions:
+                    metadata[META_EMBEDDING_DIMENSIONS] = dimensions
+                col = await client.create_collection(name=collection_name, metadata=metadata)
+            self._dimensions[collection_name] = self._check_collection(col, dimensions)
+            self._collections[collection_name] = col
+        return col
+
+    def _check_collection(self, col: Any, dimensions: Optional[int]) -> Optional[int]:
+        """Returns the collection's embedding dimensions (None = model native) after checking them."""
+        metadata = col.metadata or {}
+        model = metadata.get(META_EMBEDDING_MODEL)
+        if model and model != self.embedding_model:
+            raise EmbeddingDimensionMismatch(
+                f"Collection {col.name} was embedded with {model}, but OPENAI_EMBEDDING_MODEL is {self.embedding_model}."
+            )
+        recorded = metadata.get(META_EMBEDDING_DIMENSIONS)
+        if dimensions and recorded != dimensions:
+            raise EmbeddingDimensionMismatch(
+                f"Collection {col.name} holds {f'{recorded}-d' if recorded else 'full-size'} vectors, "
+                f"but {dimensions}-d are configured; build a copy with scripts/migrate_dimensions.py."
+            )
+        return recorded
+
+    async def get_collection_dimensions(self, collection_name: str) -> Optional[int]:
+        """Embedding dimensions recorded on a collection (None = the model's native size)."""
+        await self.get_chroma_collection(collection_name)
+        return self._dimensions.get(collection_name)
+
+    # ---------- embedding helpers ----------
+
+    def _embedding_key(self, text: str, dimensions: Optional[int] = None) -> str:
+        model = f"{self.embedding_model}:{dimensions}" if dimensions else self.embedding_model
+        return hashlib.sha256(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _embeddings_client(self) -> Any:
+        if self._openai is None:
+            raise RuntimeError("ChromaService(embeddings=False) can't embed; pass precomputed query embeddings.")
+        return self._openai
+
+    def _embedding_kwargs(self, dimensions: Optional[int]) -> Dict[str, Any]:
+        # only text-embedding-3-* accept `dimensions`; omit it for native-size vectors
+        kwargs: Dict[str, Any] = {"model": self.embedding_model}
+        if dimensions:
+            kwargs["dimensions"] = dimensions
+        return kwargs
+
+    async def _embed_one(self, text: str, dimensions: Optional[int] = None) -> List[float]:
+        async def _compute() -> List[float]:
+            emb = await upstream.acall(
+                self._embeddings_client().embeddings.with_raw_response.create,
+                input=text,
+                **self._embedding_kwargs(dimensions),
+            )
+            return emb.data[0].embedding
+
+        return await self._embedding_cache.aget_or_compute(self._embedding_key(text, dimensions), _compute)
+
+    async def _embed_many(self, texts: List[str], dimensions: Optional[int] = None) -> List[List[float]]:
+        keys = [self._embedding_key(t, dimensions) for t in texts]
+        out: List[Any] = await self._embedding_cache.aget_many(keys)
+        missing = [i for i, v in enumerate(out) if v is MISSING]
+        if missing:
+            # Batch the misses in one request; OpenAI supports list inputs
+            emb = await upstream.acall(
+                self._embeddings_client().embeddings.with_raw_response.create,
+                input=[texts[i] for i in missing],
+                **self._embedding_kwargs(dimensions),
+            )
+            # Preserve original order
+            for i, d in zip(missing, emb.data):
+                out[i] = d.embedding
+            await self._embedding_cache.aset_many([(keys[i], out[i]) for i in missing])
+        return out
+
+    async def _query_embedding(
+        self, query: str, collection_name: str, query_embedding: Optional[List[float]] = None
+    ) -> List[float]:
+        """
+        Embeds the query at the collection's dimensions. A precomputed vector must match them;
+        a longer text-embedding-3 vector is shortened, anything else raises EmbeddingDimensionMismatch.
+        """
+        dimensions = self._dimensions.get(collection_name)
+        if query_embedding is None:
+            return await self._embed_one(query, dimensions)
+        if not dimensions or len(query_embedding) == dimensions:
+            return query_embedding
+        if len(query_embedding) > dimensions and self.embedding_model in SHORTENABLE_EMBEDDING_MODELS:
+            return reduce_embedding(query_embedding, dimensions)
+        raise EmbeddingDimensionMismatch(
+            f"Query vector has {len(query_embedding)} dimensions; collection {collection_name} expects {dimensions}."
+        )
+
+    # ---------- write helpers (optional, but recommended for consistency) ----------
+
+    async def add_texts(
+        self,
+        collection_name: str,
+        texts: List[str],
+        ids: Optional[List[str]] = None,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        batch_size: int = 64,
+    ) -> None:
+        """
+        Upsert texts with **client-side embeddings** so stored vectors match query vectors.
+        """
+        if not texts:
+            return
+        if ids is not None and len(ids) != len(texts):
+            raise ValueError("len(ids) must equal len(texts)")
+        if metadatas is not None and len(metadatas) != len(texts):
+            raise ValueError("len(metadatas) must equal len(texts)")
+
+        col = await self.get_chroma_collection(collection_name)
+
+        # Chunk to avoid very large payloads
+        start = 0
+        while start < len(texts):
+            end = min(start + batch_size, len(texts))
+            chunk_texts = texts[start:end]
+            chunk_ids = ids[start:end] if ids else None
+            chunk_mds = metadatas[start:end] if metadatas else None
+
+            # Embed client-side, at the collection's recorded size
+            embeds = await self._embed_many(chunk_texts, self._dimensions.get(collection_name))
+
+            # Upsert: add if new, overwrite if the ids exist
+            await col.upsert(
+                embeddings=embeds,
+                documents=chunk_texts,
+                ids=chunk_ids,
+                metadatas=chunk_mds,
+            )
+            if chunk_ids:
+                await lexical.upsert(collection_name, chunk_ids, chunk_texts)
+            start = end
+
+    # ---------- read/search helpers ----------
+
+    @staticmethod
+    def _with_chunk_ids(raw: Dict[str, Any], metas: List[Any]) -> List[Dict[str, Any]]:
+        """Copies each metadata dict and records the Chroma record id under `chunk_id`."""
+        ids = raw.get("ids", [[]])[0] if raw.get("ids") else []
+        return [{**(meta or {}), "chunk_id": ids[i] if i < len(ids) else None} for i, meta in enumerate(metas)]
+
+    async def similarity_search_optimized(
+        self,
+        query: str,
+        collection_name: str,
+        index_key: Optional[str] = None,
+        k: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Metadata-filtered search using client-side embeddings to guarantee dimension match.
+        Pass query_embedding to reuse a vector computed elsewhere (e.g. a batched _embed_many).
+        Returns: [(text, distance, metadata), ...]
+        """
+        k = k or self.default_k
+        col = await self.get_chroma_collection(collection_name)
+
+        q_emb = await self._query_embedding(query, collection_name, query_embedding)
+        where = {"source_file": index_key} if index_key else None
+
+        raw = await col.query(
+            query_embeddings=[q_emb],
+            n_results=k,
+            where=where,
+            include=["documents", "distances", "metadatas"],
+        )
+
+        docs = raw.get("documents", [[]])[0] if raw.get("documents") else []
+        dists = raw.get("distances", [[]])[0] if raw.get("distances") else []
+        metas = raw.get("metadatas", [[]])[0] if raw.get("metadatas") else [{} for _ in docs]
+        metas = self._with_chunk_ids(raw, metas)
+        return list(zip(docs, dists, metas))
+
+    async def similarity_search_with_embeddings(
+        self,
+        query: str,
+        collection_name: str,
+        index_key: Optional[str] = None,
+        k: Optional[int] = None,
+        query_embedding: Optional[List[float]] = None,
+    ) -> Tuple[List[float], List[Tuple[str, float, Dict[str, Any], List[float]]]]:
+        """
+        Same as similarity_search_optimized, but also returns the stored vectors for reranking.
+        Returns: (query_embedding, [(text, distance, metadata, embedding), ...])
+        """
+        k = k or self.default_k
+        col = await self.get_chroma_collection(collection_name)
+
+        q_emb = await self._query_embedding(query, collection_name, query_embedding)
+        where = {"source_file": index_key} if index_key else None
+
+        raw = await col.query(
+            query_embeddings=[q_emb],
+            n_results=k,
+            where=where,
+            include=["documents", "distances", "metadatas", "embeddings"],
+        )
+
+        docs = raw.get("documents", [[]])[0] if raw.get("documents") else []
+        dists = raw.get("distances", [[]])[0] if raw.get("distances") else []
+        metas = raw.get("metadatas", [[]])[0] if raw.get("metadatas") else [{} for _ in docs]
+        metas = self._with_chunk_ids(raw, metas)
+        # embeddings may come back as a numpy array; avoid truthiness checks on it
+        embs = raw.get("embeddings")
+        embs = embs[0] if embs is not None and len(embs) else []
+        return q_emb, list(zip(docs, dists, metas, embs))
+
+    async def search(
+        self,
+        collection: str,
+        query_text: str,
+        k: int = 6,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        document_filter: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Full search with metadata + document filters.
+        Uses client-side embeddings to avoid any server-default dimension issues.
+        """
+        include = include or ["documents", "distances", "metadatas"]
+        col = await self.get_chroma_collection(collection)
+
+        q_emb = await self._query_embedding(query_text, collection)
+        raw = await col.query(
+            query_embeddings=[q_emb],
+            n_results=k,
+            where=metadata_filter,
+            where_document=document_filter,
+            include=include,
+        )
+
+        docs = raw.get("documents", [[]])[0] if raw.get("documents") else []
+        dists = raw.get("distances", [[]])[0] if raw.get("distances") else []
+        metas = raw.get("metadatas", [[]])[0] if raw.get("metadatas") else [{} for _ in docs]
+        return list(zip(docs, dists, metas))
+
+    # ---------- higher-level helpers (match your previous usage) ----------
+
+    async def process_source_results(self, question: str, source_type: str, params: Dict[str, Any]) -> Tuple[List[str], List[float]]:
+        """
+        Runs a simple search in a named collection, returns (texts, scores).
+        """
+        try:
+            results = await self.similarity_search_optimized(
+                query=question,
+                collection_name=params.get("collection", "financeilm"),
+                index_key=params.get("index_key"),
+                k=params.get("k", 5),
+            )
+            texts = [text for (text, _dist, _meta) in results]
+            scores = [dist for (_text, dist, _meta) in results]
+
+            if params.get("suffix"):
+                suffix = params["suffix"]
+                texts = [f"{t}\n{suffix}" for t in texts]
+
+            return texts, scores
+        except Exception as e:
+            logservice.logging.error(f"chromaservice.process_source_results: Error processing {source_type}: {e}")
+            return [], []
+
+    # ---------- hybrid (lexical + vector) retrieval ----------
+
+    @staticmethod
+    def _rows_by_id(raw: Dict[str, Any]) -> Dict[str, Tuple[str, Dict[str, Any], Any]]:
+        """Maps a collection.get() result to {id: (document, metadata, embedding)}."""
+        ids = raw.get("ids") or []
+        docs = raw.get("documents") or [""] * len(ids)
+        metas = raw.get("metadatas") or [{}] * len(ids)
+        embs = raw.get("embeddings")
+        embs = embs if embs is not None and len(embs) else [None] * len(ids)
+        return {cid: (docs[i], metas[i] or {}, embs[i]) for i, cid in enumerate(ids)}
+
+    @staticmethod
+    def _distance(query_embedding: List[float], embedding: Any, space: str) -> float:
+        """Distance in the collection's space, as Chroma would report it."""
+        import numpy as np
+
+        q = np.asarray(query_embedding, dtype=np.float32)
+        e = np.asarray(embedding, dtype=np.float32)
+        if space == "cosine":
+            return float(1.0 - (q @ e) / ((np.linalg.norm(q) * np.linalg.norm(e)) or 1.0))
+        if space == "ip":
+            return float(1.0 - q @ e)
+        return float(((q - e) ** 2).sum())
+
+    async def _lexical_candidates(
+        self,
+        collection_name: str,
+        hits: List[Tuple[str, float, float]],
+        with_embeddings: bool,
+        query_embedding: Optional[List[float]] = None,
+        max_score: float = 0.0,
+    ) -> List[Tuple[str, Optional[float], Dict[str, Any], Any]]:
+        """
+        Fetches lexical hits by id, in BM25 order. Their distance is the real one when a
+        precomputed query embedding is given, otherwise None: nothing was measured, and
+        callers must not mistake the chunk for a vector match at some made-up distance.
+        "bm25_ratio" is the hit's score over `max_score` (a document matching every query
+        term at saturation), the lexical strength the router judges instead of a distance.
+        """
+        col = await self.get_chroma_collection(collection_name)
+        with_embeddings = with_embeddings or query_embedding is not None
+        include = ["documents", "metadatas"] + (["embeddings"] if with_embeddings else [])
+        rows = self._rows_by_id(await col.get(ids=[cid for cid, _s, _c in hits], include=include))
+        space = (col.metadata or {}).get("hnsw:space", "l2")
+        candidates = []
+        for cid, score, _coverage in hits:
+            if cid in rows:  # skip chunks deleted since they were indexed
+                doc, meta, emb = rows[cid]
+                meta = {
+                    **meta,
+                    "chunk_id": cid,
+                    "retrieval": "lexical",
+                    "bm25": round(score, 3),
+                    "bm25_ratio": round(score / max_score, 3) if max_score else None,
+                }
+                distance = self._distance(query_embedding, emb, space) if query_embedding is not None else None
+                candidates.append((doc, distance, meta, emb))
+        return candidates
+
+    async def _fuse(
+        self,
+        collection_name: str,
+        query_embedding: List[float],
+        candidates: List[Tuple[str, float, Dict[str, Any], Any]],
+        hits: List[Tuple[str, float, float]],
+        limit: int,
+    ) -> Tuple[List[Tuple[str, float, Dict[str, Any], Any]], List[float]]:
+        """
+        Reciprocal-rank fusion of vector candidates and lexical hits. Lexical-only chunks are
+        fetched with their vectors so their true distance can be reported.
+        Returns the fused top `limit` candidates and their fused scores scaled to 0..1.
+        """
+        by_id = {c[2].get("chunk_id"): c for c in candidates}
+        fused = rrf_fuse([list(by_id), [cid for cid, _s, _c in hits]])
+        order = sorted(fused, key=fused.get, reverse=True)[:limit]
+        missing = [cid for cid in order if cid not in by_id]
+        if missing:
+            col = await self.get_chroma_collection(collection_name)
+            space = (col.metadata or {}).get("hnsw:space", "l2")
+            rows = self._rows_by_id(await col.get(ids=missing, include=["documents", "metadatas", "embeddings"]))
+            for cid, (doc, meta, emb) in rows.items():
+                distance = self._distance(query_embedding, emb, space)
+                by_id[cid] = (doc, distance, {**meta, "chunk_id": cid, "retrieval": "lexical"}, emb)
+        fused_candidates = [by_id[cid] for cid in order if cid in by_id]
+        top = max((fused[c[2]["chunk_id"]] for c in fused_candidates), default=1.0)
+        return fused_candidates, [fused[c[2]["chunk_id"]] / top for c in fused_candidates]
+
+    async def get_context_info_optimized(
+        self,
+        question: str,
+        source: str,
+        reranker: Optional[Any] = None,
+        query_embedding: Optional[List[float]] = None,
+    ) -> Tuple[List[str], Dict[str, Any], List[Optional[float]], List[Optional[str]], List[Optional[float]]]:
+        """
+        Default: search the retrieval collection (RETRIEVAL_COLLECTION, 'financeilm') for the top CONTEXT_K (8)
+        chunks and return (texts, link_extracted, scores, chunk_ids, lexical_strengths).
+        If a reranker (see rerankservice.MMRReranker) is given, over-fetch reranker.fetch_k
+        candidates with their embeddings and keep what the reranker selects.
+        Once the in-process lexical index is built (see lexicalservice), confident exact-term
+        matches are answered from it without embedding the question; other queries fuse the
+        lexical and vector rankings with reciprocal-rank fusion. Chunks of a lexical-only
+        answer have a None score (no distance) unless query_embedding was given; their
+        lexical strength is the BM25 score over the query's maximum (0..1), None for all
+        other chunks.
+        """
+        collection = self.retrieval_collection
+        k = reranker.k if reranker is not None else self.context_k
+        fetch_k = reranker.fetch_k if reranker is not None else k
+        index = lexical.get(collection)
+        hits, info = await blocking.run(index.search, question, LEXICAL_FETCH_K) if index is not None else ([], {})
+
+        if hits and lexical.is_confident(hits, info):
+            # exact-term lookup: no embedding round trip (unless precomputed), no vector query
+            metrics.incr("retrieval.lexical_only")
+            candidates = await self._lexical_candidates(
+                collection, hits[:fetch_k], reranker is not None, query_embedding, info["max_score"]
+            )
+            if reranker is not None and candidates:
+                top = candidates[0][2]["bm25"] or 1.0
+                relevance = [c[2]["bm25"] / top for c in candidates]
+                results = await blocking.run(reranker.rerank, None, candidates, relevance)
+            else:
+                results = [c[:3] for c in candidates[:k]]
+        elif reranker is None and not hits:
+            metrics.incr("retrieval.vector_only")
+            results = await self.similarity_search_optimized(
+                question,
+                collection_name=collection,
+                index_key=None,
+                k=k,
+                query_embedding=query_embedding,
+            )
+        else:
+            q_emb, candidates = await self.similarity_search_with_embeddings(
+                question,
+                collection_name=collection,
+                index_key=None,
+                k=fetch_k,
+                query_embedding=query_embedding,
+            )
+            relevance = None
+            if hits:
+                metrics.incr("retrieval.fused")
+                candidates, relevance = await self._fuse(collection, q_emb, candidates, hits, fetch_k)
+            else:
+                metrics.incr("retrieval.vector_only")
+            if reranker is not None:
+                # numpy + tokenizer work: keep it off the event loop
+                results = await blocking.run(reranker.rerank, q_emb, candidates, relevance)
+            else:
+                results = [c[:3] for c in candidates[:k]]
+        text_l = [t for (t, _dist, _meta) in results]
+        scores = [dist for (_t, dist, _m) in results]
+        metadata =  [meta for (_t, _dist, meta) in results]
+        chunk_ids = [meta.get("chunk_id") for meta in metadata]
+        lexical_strengths = [meta.get("bm25_ratio") for meta in metadata]
+        link_extracted: Dict[str, Any] = {}
+        print("#########################################")
+        print(f"Metadata: {metadata}")
+        return text_l, link_extracted, scores, chunk_ids, lexical_strengths
+
+
+@lru_cache(maxsize=1)
+def get_chroma_service() -> ChromaService:
+    """
+    Process-wide ChromaService: one async Chroma HTTP client (and its connection pool),
+    one async OpenAI embeddings client and one set of cached collection handles per worker.
+    """
+    return ChromaService()
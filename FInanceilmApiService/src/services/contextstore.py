@@ -0,0 +1,60 @@
+# src/services/contextstore.py
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from src.services.cacheservice import MISSING, get_cache
+
+# How long a referenced context stays fetchable from GET /api/v1/context/{id}
+CONTEXT_TTL_S = float(os.getenv("CONTEXT_TTL_S", "900"))
+CONTEXT_STORE_MAX_ENTRIES = int(os.getenv("CONTEXT_STORE_MAX_ENTRIES", "5000"))
+# The context id is fetched in a later request that may land on any worker, so the store
+# is host-shared (sqlite) whatever CACHE_BACKEND says. "local" is only correct with a
+# single worker process.
+CONTEXT_STORE_BACKEND = os.getenv("CONTEXT_STORE_BACKEND", "sqlite")
+
+# Response context modes
+#   inline:    {"context": {"text", "link"}}  (default, unchanged)
+#   reference: {"context": {"id", "href", "chunks": [{"id", "score"}], "link"}}; text fetched lazily
+CONTEXT_MODES = ("inline", "reference")
+
+
+def _store():
+    return get_cache(
+        "context", max_entries=CONTEXT_STORE_MAX_ENTRIES, ttl=CONTEXT_TTL_S, backend=CONTEXT_STORE_BACKEND
+    )
+
+
+def context_id(text: str, link: Any) -> str:
+    """Content-addressed id: identical contexts share one entry, and the id doubles as the ETag."""
+    digest = hashlib.sha256()
+    digest.update(text.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(json.dumps(link, sort_keys=True, default=str).encode("utf-8"))
+    return digest.hexdigest()[:32]
+
+
+async def store_context(text: str, link: Any, chunks: Optional[List[Dict[str, Any]]]) -> str:
+    cid = context_id(text, link)
+    await _store().aset(cid, {"text": text, "link": link, "chunks": chunks or []})
+    return cid
+
+
+async def fetch_context(cid: str) -> Optional[Dict[str, Any]]:
+    value = await _store().aget(cid)
+    return None if value is MISSING else value
+
+
+async def context_payload(context: tuple, mode: str) -> Dict[str, Any]:
+    """
+    Builds the `context` field of a response from FinanceILM.get_context's tuple.
+    In reference mode the full text is stored and only its id, chunk ids and scores are returned.
+    """
+    text, link = context[0], context[1]
+    if mode != "reference":
+        return {"text": text, "link": link}
+    chunks = context[3] if len(context) > 3 else []
+    cid = await store_context(text, link, chunks)
+    return {"id": cid, "href": f"/api/v1/context/{cid}", "chunks": chunks or [], "link": link}
@@ -0,0 +1,90 @@
+# src/services/executorservice.py
+
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from src.services.metricsservice import metrics
+
+# Threads for the blocking work left on the request path (SQLite cache, tokenizer/numpy
+# reranking). Network I/O (Chroma, OpenAI) is async and never takes one of these.
+BLOCKING_EXECUTOR_WORKERS = int(os.getenv("BLOCKING_EXECUTOR_WORKERS", "16"))
+
+
+class BlockingExecutor:
+    """
+    Dedicated, sized thread pool for short blocking calls made from the event loop.
+
+    - Separate from asyncio's default executor, so nothing else can starve it (and vice versa).
+    - Instrumented: executor.<name>.queued / .active gauges, .wait_ms (time spent queued)
+      and .run_ms summaries, and a .saturated counter for submissions that had to queue.
+    - Copies the caller's contextvars (request deadline, ...) into the worker thread.
+    - A call cancelled while still queued is dropped without ever running.
+    """
+
+    def __init__(self, name: str, max_workers: int) -> None:
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+            return self._pool
+
+    def _publish(self) -> None:
+        metrics.set_gauge(f"executor.{self.name}.queued", self._queued)
+        metrics.set_gauge(f"executor.{self.name}.active", self._active)
+
+    async def run(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        ctx = contextvars.copy_context()
+        submitted = time.monotonic()
+
+        def _job() -> Any:
+            started = time.monotonic()
+            with self._lock:
+                self._queued -= 1
+                self._active += 1
+                self._publish()
+            metrics.observe(f"executor.{self.name}.wait_ms", (started - submitted) * 1000)
+            try:
+                return ctx.run(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._publish()
+                metrics.observe(f"executor.{self.name}.run_ms", (time.monotonic() - started) * 1000)
+
+        pool = self._get_pool()
+        with self._lock:
+            if self._active + self._queued >= self.max_workers:
+                metrics.incr(f"executor.{self.name}.saturated")
+            self._queued += 1
+            self._publish()
+        future = pool.submit(_job)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancel():
+                # never started: _job won't run, so undo its queue slot here
+                with self._lock:
+                    self._queued -= 1
+                    self._publish()
+            raise
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+blocking = BlockingExecutor("blocking", BLOCKING_EXECUTOR_WORKERS)
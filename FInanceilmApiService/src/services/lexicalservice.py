@@ -0,0 +1,315 @@
+# src/services/lexicalservice.py
+
+import asyncio
+import math
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from src.services import logservice
+from src.services.executorservice import blocking
+from src.services.metricsservice import metrics
+
+LEXICAL_ENABLED = os.getenv("LEXICAL_ENABLED", "1") == "1"
+# Seconds between incremental refreshes (new/removed ids) and full rebuilds (edited documents)
+LEXICAL_REFRESH_S = float(os.getenv("LEXICAL_REFRESH_S", "300"))
+LEXICAL_REBUILD_S = float(os.getenv("LEXICAL_REBUILD_S", str(24 * 3600)))
+LEXICAL_PAGE_SIZE = int(os.getenv("LEXICAL_PAGE_SIZE", "1000"))
+# Lexical candidates fused with the vector candidates
+LEXICAL_FETCH_K = int(os.getenv("LEXICAL_FETCH_K", "20"))
+# Reciprocal-rank fusion constant: score = sum(1 / (RRF_K + rank))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# A query is answered from the lexical index alone (no embedding call) when it is a short
+# lookup, contains at least one rare term, and the best chunk contains every query term
+# with a BM25 score of at least LEXICAL_MIN_SCORE_RATIO of the maximum attainable.
+LEXICAL_MAX_QUERY_TERMS = int(os.getenv("LEXICAL_MAX_QUERY_TERMS", "6"))
+LEXICAL_MIN_IDF = float(os.getenv("LEXICAL_MIN_IDF", "3.0"))
+LEXICAL_MIN_SCORE_RATIO = float(os.getenv("LEXICAL_MIN_SCORE_RATIO", "0.4"))
+
+_TOKEN = re.compile(r"[^\W_]+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i in is it its me my of on or "
+    "our should that the their this to was what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall((text or "").lower()) if t not in _STOPWORDS]
+
+
+class LexicalIndex:
+    """
+    In-process BM25 inverted index over one collection's documents.
+
+    - Postings are two typed arrays per term (doc numbers 'I', term frequencies 'H'); documents
+      are numbered in insertion order, so appends keep every posting list sorted.
+    - Only ids, lengths and postings are held; chunk text stays in Chroma.
+    - Upserts append a new doc number and tombstone the old one; removals tombstone.
+      Posting lists are compacted once tombstones exceed a quarter of the documents.
+    - Scoring is vectorized with numpy over zero-copy views of the arrays (views never outlive
+      a locked call, so writers can always grow the arrays).
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._ids: List[Optional[str]] = []
+        self._pos: Dict[str, int] = {}
+        self._lengths = array("I")
+        self._live = bytearray()
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._total_length = 0
+        self._dead = 0
+
+    def __len__(self) -> int:
+        return len(self._pos)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._pos
+
+    def ids(self) -> List[str]:
+        with self._lock:
+            return list(self._pos)
+
+    # ---------- writes ----------
+
+    def _remove(self, chunk_id: str) -> None:
+        doc = self._pos.pop(chunk_id, None)
+        if doc is None:
+            return
+        self._live[doc] = 0
+        self._ids[doc] = None
+        self._total_length -= self._lengths[doc]
+        self._dead += 1
+
+    def upsert_many(self, chunk_ids: Iterable[str], documents: Iterable[Optional[str]]) -> None:
+        analyzed = [(cid, Counter(tokenize(doc or ""))) for cid, doc in zip(chunk_ids, documents)]
+        with self._lock:
+            for cid, counts in analyzed:
+                self._remove(cid)
+                doc = len(self._ids)
+                length = sum(counts.values())
+                self._ids.append(cid)
+                self._pos[cid] = doc
+                self._lengths.append(length)
+                self._live.append(1)
+                self._total_length += length
+                for term, tf in counts.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array("I"), array("H"))
+                    postings[0].append(doc)
+                    postings[1].append(min(tf, 65535))
+            self._maybe_compact()
+
+    def remove_many(self, chunk_ids: Iterable[str]) -> None:
+        with self._lock:
+            for cid in chunk_ids:
+                self._remove(cid)
+            self._maybe_compact()
+
+    def _maybe_compact(self) -> None:
+        if self._dead * 4 <= len(self._ids):
+            return
+        live = np.frombuffer(self._live, dtype=np.uint8).astype(bool)
+        remap = np.cumsum(live, dtype=np.int64) - 1
+        postings: Dict[str, Tuple[array, array]] = {}
+        for term, (docs_arr, tfs_arr) in self._postings.items():
+            docs = np.frombuffer(docs_arr, dtype=np.uint32)
+            keep = live[docs]
+            if keep.any():
+                postings[term] = (
+                    array("I", remap[docs[keep]].astype(np.uint32).tobytes()),
+                    array("H", np.frombuffer(tfs_arr, dtype=np.uint16)[keep].tobytes()),
+                )
+        lengths = np.frombuffer(self._lengths, dtype=np.uint32)[live]
+        self._ids = [cid for cid in self._ids if cid is not None]
+        self._pos = {cid: i for i, cid in enumerate(self._ids)}
+        self._lengths = array("I", lengths.tobytes())
+        self._live = bytearray(b"\x01" * len(self._ids))
+        self._postings = postings
+        self._dead = 0
+
+    # ---------- search ----------
+
+    def search(self, query: str, k: int) -> Tuple[List[Tuple[str, float, float]], Dict[str, float]]:
+        """
+        BM25 top-k. Returns ([(chunk_id, score, coverage), ...], info) where coverage is the share
+        of query terms the chunk contains, and info holds the query's term count, its highest idf
+        and the highest score attainable (sum of idf * (k1 + 1)).
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        info = {"terms": len(terms), "max_idf": 0.0, "max_score": 0.0}
+        with self._lock:
+            n_live = len(self._pos)
+            if not terms or n_live == 0:
+                return [], info
+            live = np.frombuffer(self._live, dtype=np.uint8).astype(bool)
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32).astype(np.float32)
+            avg_length = max(self._total_length / n_live, 1.0)
+            norm = self.k1 * (1.0 - self.b + self.b * lengths / avg_length)
+            scores = np.zeros(len(self._ids), dtype=np.float32)
+            matched = np.zeros(len(self._ids), dtype=np.float32)
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                docs = np.frombuffer(postings[0], dtype=np.uint32)
+                keep = live[docs]
+                docs = docs[keep]
+                if docs.size == 0:
+                    continue
+                tfs = np.frombuffer(postings[1], dtype=np.uint16)[keep].astype(np.float32)
+                idf = math.log(1.0 + (n_live - docs.size + 0.5) / (docs.size + 0.5))
+                scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm[docs])
+                matched[docs] += 1.0
+                info["max_idf"] = max(info["max_idf"], idf)
+                info["max_score"] += idf * (self.k1 + 1.0)
+            hits = np.flatnonzero(scores)
+            if hits.size > k:
+                hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+            hits = hits[np.argsort(-scores[hits], kind="stable")]
+            results = [(self._ids[d], float(scores[d]), float(matched[d]) / len(terms)) for d in hits]
+            return results, info
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            postings_bytes = sum(d.itemsize * len(d) + f.itemsize * len(f) for d, f in self._postings.values())
+            return {"docs": len(self._pos), "terms": len(self._postings), "postings_bytes": postings_bytes}
+
+
+def rrf_fuse(rankings: List[List[str]], k: int = RRF_K) -> Dict[str, float]:
+    """Reciprocal-rank fusion: each ranked id list contributes 1 / (k + rank) per id."""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            fused[cid] = fused.get(cid, 0.0) + 1.0 / (k + rank)
+    return fused
+
+
+class LexicalService:
+    """
+    Keeps a LexicalIndex per collection in sync with Chroma, in the background.
+
+    - Built from the collection's documents page by page, after startup.
+    - Every refresh_s: an ids-only scan indexes new chunks and drops deleted ones.
+    - Every rebuild_s: a full rebuild, which also picks up documents edited in place.
+    - Writes made through ChromaService.add_texts are applied immediately (upsert()).
+    Until an index is built, retrieval is vector-only.
+    """
+
+    def __init__(self, enabled: bool, refresh_s: float, rebuild_s: float, page_size: int) -> None:
+        self.enabled = enabled
+        self.refresh_s = refresh_s
+        self.rebuild_s = rebuild_s
+        self.page_size = page_size
+        self._indexes: Dict[str, LexicalIndex] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls) -> "LexicalService":
+        return cls(LEXICAL_ENABLED, LEXICAL_REFRESH_S, LEXICAL_REBUILD_S, LEXICAL_PAGE_SIZE)
+
+    def get(self, collection_name: str) -> Optional[LexicalIndex]:
+        return self._indexes.get(collection_name) if self.enabled else None
+
+    def is_confident(self, hits: List[Tuple[str, float, float]], info: Dict[str, float]) -> bool:
+        """True when the top hit is a strong, complete match for a short lookup-style query."""
+        if not hits or not info["max_score"]:
+            return False
+        _cid, score, coverage = hits[0]
+        return (
+            info["terms"] <= LEXICAL_MAX_QUERY_TERMS
+            and info["max_idf"] >= LEXICAL_MIN_IDF
+            and coverage >= 1.0
+            and score / info["max_score"] >= LEXICAL_MIN_SCORE_RATIO
+        )
+
+    # ---------- sync with Chroma ----------
+
+    async def _pages(self, col: Any, include: List[str]):
+        offset = 0
+        while True:
+            page = await col.get(include=include, limit=self.page_size, offset=offset)
+            ids = page.get("ids") or []
+            if not ids:
+                return
+            yield page
+            offset += len(ids)
+
+    async def build(self, svc: Any, collection_name: str) -> LexicalIndex:
+        col = await svc.get_chroma_collection(collection_name)
+        index = LexicalIndex()
+        async for page in self._pages(col, ["documents"]):
+            await blocking.run(index.upsert_many, page["ids"], page.get("documents") or [])
+        self._indexes[collection_name] = index
+        self._publish(index)
+        return index
+
+    async def refresh(self, svc: Any, collection_name: str) -> None:
+        index = self._indexes.get(collection_name)
+        if index is None:
+            await self.build(svc, collection_name)
+            return
+        col = await svc.get_chroma_collection(collection_name)
+        seen = set()
+        async for page in self._pages(col, []):
+            new_ids = [cid for cid in page["ids"] if cid not in index]
+            seen.update(page["ids"])
+            if new_ids:
+                fetched = await col.get(ids=new_ids, include=["documents"])
+                await blocking.run(index.upsert_many, fetched["ids"], fetched.get("documents") or [])
+        removed = [cid for cid in index.ids() if cid not in seen]
+        if removed:
+            await blocking.run(index.remove_many, removed)
+        self._publish(index)
+
+    async def upsert(self, collection_name: str, chunk_ids: List[str], documents: List[str]) -> None:
+        index = self._indexes.get(collection_name)
+        if index is not None:
+            await blocking.run(index.upsert_many, chunk_ids, documents)
+
+    @staticmethod
+    def _publish(index: LexicalIndex) -> None:
+        for name, value in index.stats().items():
+            metrics.set_gauge(f"lexical.{name}", value)
+
+    async def _run(self) -> None:
+        from src.services.chromaservice import get_chroma_service
+
+        svc, collection_name = None, None
+        since_rebuild = 0.0
+        while True:
+            try:
+                if svc is None:
+                    svc = await blocking.run(get_chroma_service)
+                    collection_name = svc.retrieval_collection
+                if collection_name not in self._indexes or since_rebuild >= self.rebuild_s:
+                    await self.build(svc, collection_name)
+                    since_rebuild = 0.0
+                    logservice.logging.info("Lexical index for %s built: %s", collection_name,
+                                            self._indexes[collection_name].stats())
+                else:
+                    await self.refresh(svc, collection_name)
+            except Exception as e:
+                logservice.logging.error("Lexical index sync for %s failed: %s", collection_name, e)
+            await asyncio.sleep(self.refresh_s)
+            since_rebuild += self.refresh_s
+
+    def start(self) -> None:
+        """Builds and then keeps refreshing the retrieval collection's index in the background."""
+        if self.enabled and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+
+
+lexical = LexicalService.from_env()
@@ -0,0 +1,6 @@
+import logging
+logging.basicConfig(
+    filename='logs/logs.log',
+    level=logging.DEBUG,  
+    format='%(asctime)s %(levelname)s:%(message)s'
+)
\ No newline at end of file
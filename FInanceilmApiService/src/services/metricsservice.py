@@ -0,0 +1,72 @@
+# src/services/metricsservice.py
+
+import threading
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict
+
+
+class Metrics:
+    """
+    Process-local metrics registry.
+
+    - Counters only go up (requests, tokens saved, ...).
+    - Gauges hold the latest value (queue depth, in-flight, ...).
+    - Summaries keep count/sum/max plus a bounded window of recent samples for p50/p99.
+    Thread-safe so it can be used from asyncio.to_thread workers as well as the event loop.
+    """
+
+    def __init__(self, window: int = 1024) -> None:
+        self._lock = threading.Lock()
+        self._window = window
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._samples: Dict[str, Deque[float]] = {}
+
+    def incr(self, name: str, value: float = 1.0) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            s = self._summaries.get(name)
+            if s is None:
+                s = self._summaries[name] = {"count": 0, "sum": 0.0, "max": value}
+                self._samples[name] = deque(maxlen=self._window)
+            s["count"] += 1
+            s["sum"] += value
+            s["max"] = max(s["max"], value)
+            self._samples[name].append(value)
+
+    @staticmethod
+    def _quantile(values: list, q: float) -> float:
+        if not values:
+            return 0.0
+        idx = min(len(values) - 1, int(round(q * (len(values) - 1))))
+        return values[idx]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            summaries = {}
+            for name, s in self._summaries.items():
+                ordered = sorted(self._samples[name])
+                summaries[name] = {
+                    "count": s["count"],
+                    "sum": s["sum"],
+                    "avg": s["sum"] / s["count"] if s["count"] else 0.0,
+                    "max": s["max"],
+                    "p50": self._quantile(ordered, 0.50),
+                    "p99": self._quantile(ordered, 0.99),
+                }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": summaries,
+            }
+
+
+metrics = Metrics()
@@ -0,0 +1,101 @@
+from __future__ import annotations
+from functools import lru_cache
+from typing import Generator, Union, Dict, Any, TYPE_CHECKING
+from dotenv import load_dotenv
+from src.services.metricsservice import metrics
+from src.services.retryservice import upstream
+load_dotenv()
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI, AsyncStream, OpenAI
+    from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+
+@lru_cache(maxsize=1)
+def get_client() -> OpenAI:
+    """
+    Creates the OpenAI client on first use (or during app startup); importing `openai`
+    and building the client at import time slows down worker cold starts.
+    Retries are done by the shared upstream scheduler, not by the SDK.
+    """
+    from openai import OpenAI
+    return OpenAI(max_retries=0)
+
+
+@lru_cache(maxsize=1)
+def get_async_client() -> AsyncOpenAI:
+    """AsyncOpenAI counterpart of get_client(), used by the streaming pipeline."""
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(max_retries=0)
+
+
+def __getattr__(name):
+    # keeps `openaiservice.client` working, but lazily
+    if name == "client":
+        return get_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Defaults used if not provided via **kwargs
+_DEFAULTS: Dict[str, Any] = {
+    "model": "gpt-4o-mini",
+    "max_tokens": 1200,
+    "temperature": 0.1,
+}
+
+def record_usage(usage: Any) -> None:
+    """
+    Records token usage of a completion, including the prompt tokens served from
+    the provider's prefix cache (usage.prompt_tokens_details.cached_tokens).
+    """
+    if usage is None:
+        return
+    if isinstance(usage, dict):
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        details = usage.get("prompt_tokens_details") or {}
+        cached_tokens = details.get("cached_tokens") or 0
+    else:
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details is not None else 0
+
+    metrics.incr("openai.prompt_tokens", prompt_tokens)
+    metrics.incr("openai.completion_tokens", completion_tokens)
+    metrics.incr("openai.cached_tokens", cached_tokens)
+    if prompt_tokens:
+        metrics.observe("openai.cached_ratio", cached_tokens / prompt_tokens)
+
+def chat_create(**kwargs) -> Union[ChatCompletion, Generator[ChatCompletionChunk, None, None]]:
+    """chat.completions.create routed through the upstream retry/pacing scheduler."""
+    return upstream.call(get_client().chat.completions.with_raw_response.create, **kwargs)
+
+async def achat_create(**kwargs) -> Union[ChatCompletion, AsyncStream[ChatCompletionChunk]]:
+    """Async chat.completions.create routed through the upstream retry/pacing scheduler."""
+    return await upstream.acall(get_async_client().chat.completions.with_raw_response.create, **kwargs)
+
+def _merge_completion_kwargs(kwargs: Dict[str, Any]):
+    # merge defaults without clobbering caller-specified values
+    merged = {**_DEFAULTS, **kwargs}
+
+    # infer streaming
+    stream = bool(merged.pop("stream", False))
+
+    # optional convenience flag: include token usage in streaming tail chunk
+    include_usage = bool(merged.pop("include_usage", False))
+    if stream and include_usage:
+        so = dict(merged.get("stream_options", {}))
+        so["include_usage"] = True
+        merged["stream_options"] = so
+    return merged, stream
+
+async def aparsed_completion_v1(**kwargs) -> Union[ChatCompletion, AsyncStream[ChatCompletionChunk]]:
+    """
+    chat.completions.create with defaults merged (see _DEFAULTS) for streaming and
+    non-streaming requests. Pass include_usage=True to add stream_options={'include_usage': True}.
+    Streams are AsyncStreams that can be closed as soon as the client goes away.
+    """
+    merged, stream = _merge_completion_kwargs(kwargs)
+    if stream:
+        return await achat_create(stream=True, **merged)
+    return await achat_create(**merged)
@@ -0,0 +1,128 @@
+# src/services/readinessservice.py
+
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from src.config import get_tokenizer
+from src.services import logservice
+from src.services.executorservice import blocking
+from src.services.metricsservice import metrics
+
+# Collections resolved during warm-up
+WARMUP_COLLECTIONS = [c for c in os.getenv("WARMUP_COLLECTIONS", os.getenv("RETRIEVAL_COLLECTION", "financeilm")).split(",") if c]
+# Optional file with one frequent question per line; the first WARMUP_TOP_N are pre-embedded
+WARMUP_QUERIES_FILE = os.getenv("WARMUP_QUERIES_FILE")
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", "100"))
+# Don't hammer a dependency that is down: minimum delay between warm-up attempts
+WARMUP_RETRY_S = float(os.getenv("WARMUP_RETRY_S", "10"))
+# Once ready, the checks are re-run in the background when the last result is older than this,
+# so a worker whose Chroma or OpenAI went away stops reporting ready
+READINESS_TTL_S = float(os.getenv("READINESS_TTL_S", "30"))
+
+
+class Readiness:
+    """
+    Startup warm-up and readiness state for /readyz.
+
+    Runs each check once at startup (tokenizer, Chroma connection + collection handles,
+    OpenAI keep-alive on the async clients used by requests, optional embedding preload), recording its latency. The worker
+    reports ready only once every required check has passed; failed checks are retried
+    when /readyz is polled, at most every WARMUP_RETRY_S seconds. A ready worker is
+    re-checked (Chroma heartbeat, OpenAI round trip) once its result is older than
+    READINESS_TTL_S; /readyz answers from the last result meanwhile.
+    """
+
+    def __init__(self) -> None:
+        self.checks: Dict[str, Dict[str, Any]] = {}
+        self.ready = False
+        self._task: Optional[asyncio.Task] = None
+        self._last_attempt = 0.0
+
+    async def _run_check(self, name: str, fn: Callable[[], Awaitable[Any]], required: bool = True) -> bool:
+        started = time.monotonic()
+        try:
+            detail = await fn()
+            latency_ms = (time.monotonic() - started) * 1000
+            self.checks[name] = {"ok": True, "required": required, "latency_ms": round(latency_ms, 1)}
+            if detail is not None:
+                self.checks[name]["detail"] = detail
+            metrics.observe(f"readiness.{name}_ms", latency_ms)
+            return True
+        except Exception as e:
+            self.checks[name] = {"ok": False, "required": required, "error": str(e)}
+            logservice.logging.error("Readiness check %s failed: %s", name, e)
+            return not required
+
+    # ---------- checks ----------
+
+    async def _tokenizer(self) -> None:
+        await blocking.run(get_tokenizer)
+
+    async def _chroma(self) -> Dict[str, Any]:
+        from src.services.chromaservice import get_chroma_service
+
+        svc = await blocking.run(get_chroma_service)
+        client = await svc.get_chroma_client()
+        await client.heartbeat()
+        for name in WARMUP_COLLECTIONS:
+            await svc.get_chroma_collection(name)
+        return {"collections": WARMUP_COLLECTIONS}
+
+    async def _openai(self) -> None:
+        from src.services.chromaservice import get_chroma_service
+        from src.services.openaiservice import get_async_client
+
+        # one cheap authenticated round trip per client opens the keep-alive connections
+        await get_async_client().models.retrieve("gpt-4o-mini")
+        svc = await blocking.run(get_chroma_service)
+        await svc._openai.models.retrieve(svc.embedding_model)
+
+    async def _preload_embeddings(self) -> Dict[str, Any]:
+        from src.services.chromaservice import get_chroma_service
+
+        questions = load_warmup_queries(WARMUP_QUERIES_FILE, WARMUP_TOP_N)
+        if questions:
+            svc = await blocking.run(get_chroma_service)
+            dimensions = await svc.get_collection_dimensions(svc.retrieval_collection)
+            await svc._embed_many(questions, dimensions)
+        return {"preloaded": len(questions)}
+
+    # ---------- lifecycle ----------
+
+    async def warm_up(self) -> bool:
+        self._last_attempt = time.monotonic()
+        results = [
+            await self._run_check("tokenizer", self._tokenizer),
+            await self._run_check("chroma", self._chroma),
+            await self._run_check("openai", self._openai),
+        ]
+        if WARMUP_QUERIES_FILE and not self.checks.get("embedding_preload", {}).get("ok"):
+            results.append(await self._run_check("embedding_preload", self._preload_embeddings, required=False))
+        self.ready = all(results)
+        metrics.set_gauge("readiness.ready", 1.0 if self.ready else 0.0)
+        logservice.logging.info("Warm-up finished; ready=%s", self.ready)
+        return self.ready
+
+    def start(self) -> None:
+        """Starts the warm-up in the background so the worker can answer /healthz meanwhile."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.warm_up())
+
+    def status(self) -> Dict[str, Any]:
+        if self._task is None or self._task.done():
+            age = time.monotonic() - self._last_attempt
+            if age >= (READINESS_TTL_S if self.ready else WARMUP_RETRY_S):
+                self.start()
+        return {"ready": self.ready, "checks": self.checks}
+
+
+def load_warmup_queries(path: Optional[str], limit: int) -> List[str]:
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()][:limit]
+
+
+readiness = Readiness()
@@ -0,0 +1,114 @@
+# src/services/rerankservice.py
+
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.config import get_tokenizer
+from src.services import logservice
+from src.services.metricsservice import metrics
+
+
+class MMRReranker:
+    """
+    Maximal Marginal Relevance reranking with near-duplicate elimination.
+
+    - Takes over-fetched candidates (text, distance, metadata, embedding) plus the query embedding.
+    - Computes query relevance and the full pairwise cosine matrix in one vectorized pass.
+    - Greedily picks chunks maximising  lambda * rel - (1 - lambda) * max_sim_to_selected.
+    - Drops any candidate whose similarity to an already selected chunk exceeds duplicate_threshold.
+    """
+
+    def __init__(
+        self,
+        k: int = 8,
+        fetch_k: int | None = None,
+        lambda_mult: float | None = None,
+        duplicate_threshold: float | None = None,
+    ) -> None:
+        self.k = k
+        self.fetch_k = fetch_k or int(os.getenv("MMR_FETCH_K", str(2 * k)))
+        self.lambda_mult = lambda_mult if lambda_mult is not None else float(os.getenv("MMR_LAMBDA", "0.7"))
+        self.duplicate_threshold = (
+            duplicate_threshold
+            if duplicate_threshold is not None
+            else float(os.getenv("MMR_DUPLICATE_THRESHOLD", "0.95"))
+        )
+
+    @staticmethod
+    def _normalize(m: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(m, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return m / norms
+
+    def select(
+        self,
+        query_embedding: Optional[Sequence[float]],
+        embeddings: Sequence[Sequence[float]],
+        relevance: Optional[Sequence[float]] = None,
+    ) -> List[int]:
+        """
+        Returns the indices of the selected candidates, in MMR order.
+        Pass relevance (0..1 per candidate, e.g. fused rank scores) to use it instead of the
+        cosine similarity to the query; query_embedding may then be None.
+        """
+        n = len(embeddings)
+        if n == 0:
+            return []
+
+        emb = self._normalize(np.asarray(embeddings, dtype=np.float32))
+        if relevance is None:
+            relevance = emb @ self._normalize(np.asarray(query_embedding, dtype=np.float32))
+        else:
+            relevance = np.asarray(relevance, dtype=np.float32)
+        pairwise = emb @ emb.T
+
+        selected: List[int] = []
+        available = np.ones(n, dtype=bool)
+        max_sim = np.full(n, -np.inf, dtype=np.float32)
+
+        while available.any() and len(selected) < self.k:
+            redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+            mmr = self.lambda_mult * relevance - (1.0 - self.lambda_mult) * redundancy
+            mmr[~available] = -np.inf
+            best = int(np.argmax(mmr))
+            selected.append(best)
+            available[best] = False
+
+            max_sim = np.maximum(max_sim, pairwise[best])
+            # Near-duplicates of anything already chosen are never worth the prompt tokens
+            available &= max_sim < self.duplicate_threshold
+
+        return selected
+
+    def rerank(
+        self,
+        query_embedding: Optional[Sequence[float]],
+        results: List[Tuple[str, float, Dict[str, Any], Sequence[float]]],
+        relevance: Optional[Sequence[float]] = None,
+    ) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Reranks (text, distance, metadata, embedding) candidates and returns the kept
+        (text, distance, metadata) triples. Logs and records the prompt tokens saved
+        compared to the plain top-k by distance.
+        """
+        if not results:
+            return []
+
+        order = self.select(query_embedding, [emb for (_t, _d, _m, emb) in results], relevance)
+        kept = [results[i][:3] for i in order]
+
+        tokenizer = get_tokenizer()
+        baseline_tokens = sum(len(tokenizer.encode(t, disallowed_special=())) for (t, _d, _m, _e) in results[: self.k])
+        kept_tokens = sum(len(tokenizer.encode(t, disallowed_special=())) for (t, _d, _m) in kept)
+        saved = max(0, baseline_tokens - kept_tokens)
+
+        metrics.incr("rerank.requests")
+        metrics.incr("rerank.tokens_saved", saved)
+        metrics.observe("rerank.dropped_chunks", len(results) - len(kept))
+        logservice.logging.info(
+            "MMR rerank kept %d/%d chunks, %d prompt tokens saved vs top-%d.",
+            len(kept), len(results), saved, self.k,
+        )
+        return kept
@@ -0,0 +1,245 @@
+# src/services/retryservice.py
+
+import asyncio
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from src.services import logservice
+from src.services.metricsservice import metrics
+
+# Absolute time.monotonic() deadline of the request being served; propagates into
+# asyncio.to_thread workers and the blocking executor because they copy the current context.
+_request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+REQUEST_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S", "60"))
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def set_request_deadline(seconds: Optional[float] = None) -> float:
+    """Sets the deadline for upstream calls made on behalf of the current request."""
+    deadline = time.monotonic() + (seconds if seconds is not None else REQUEST_DEADLINE_S)
+    _request_deadline.set(deadline)
+    return deadline
+
+
+def current_deadline() -> Optional[float]:
+    return _request_deadline.get()
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parses OpenAI reset/retry durations ("20ms", "1s", "6m0s", "1h2m3.5s", or plain seconds).
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total, matched = 0.0, False
+    for number, unit in _DURATION_PART.findall(value):
+        matched = True
+        total += float(number) * {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}[unit]
+    return total if matched else None
+
+
+class _Pacing:
+    __slots__ = ("resume_at", "next_slot")
+
+    def __init__(self) -> None:
+        self.resume_at = 0.0  # nobody calls before this (set after 429s)
+        self.next_slot = 0.0  # proactive pacing when quota runs low
+
+
+class UpstreamScheduler:
+    """
+    Shared scheduler for OpenAI calls (chat and embeddings).
+
+    - Retries rate limits, connection errors and 5xx with exponential backoff + full jitter.
+    - Honors retry-after / retry-after-ms, and pauses every caller of the model after a 429.
+    - Reads x-ratelimit-remaining-* and paces requests when remaining quota runs low.
+    - OpenAI rate-limits each model separately, so pausing and pacing are kept per model
+      (the call's `model` argument): a 429 on embeddings never holds back chat completions.
+    - Never sleeps past the request deadline: gives up and re-raises instead.
+    Expects `with_raw_response` callables so headers are visible; returns the parsed result.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        low_watermark: float = 0.1,
+    ) -> None:
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.low_watermark = low_watermark
+        self._lock = threading.Lock()
+        self._pacing: Dict[str, _Pacing] = {}
+
+    @classmethod
+    def from_env(cls) -> "UpstreamScheduler":
+        return cls(
+            max_retries=int(os.getenv("UPSTREAM_MAX_RETRIES", "4")),
+            base_delay=float(os.getenv("UPSTREAM_BASE_DELAY_S", "0.5")),
+            max_delay=float(os.getenv("UPSTREAM_MAX_DELAY_S", "8")),
+            low_watermark=float(os.getenv("UPSTREAM_LOW_WATERMARK", "0.1")),
+        )
+
+    # ---------- pacing ----------
+
+    def _state(self, key: str) -> _Pacing:
+        # callers hold self._lock
+        state = self._pacing.get(key)
+        if state is None:
+            state = self._pacing[key] = _Pacing()
+        return state
+
+    def _reserve_wait(self, key: str) -> float:
+        """Returns how long this caller must wait before calling upstream."""
+        with self._lock:
+            state = self._state(key)
+            now = time.monotonic()
+            start = max(now, state.resume_at, state.next_slot)
+            if state.next_slot > now:
+                # claim the paced slot so concurrent callers spread out
+                interval = state.next_slot - now
+                state.next_slot = start + interval
+            return start - now
+
+    def _observe_headers(self, key: str, headers: Mapping[str, str]) -> None:
+        pace = 0.0
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if remaining is None or limit is None or reset is None:
+                continue
+            try:
+                remaining_f, limit_f = float(remaining), float(limit)
+            except ValueError:
+                continue
+            if limit_f > 0 and remaining_f / limit_f <= self.low_watermark:
+                # spread the remaining quota evenly over the reset window
+                pace = max(pace, reset / max(remaining_f, 1.0))
+        with self._lock:
+            state = self._state(key)
+            if pace > 0:
+                state.next_slot = max(state.next_slot, time.monotonic() + pace)
+                metrics.incr("upstream.paced")
+            else:
+                state.next_slot = 0.0
+
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms:
+            try:
+                return float(retry_after_ms) / 1000.0
+            except ValueError:
+                pass
+        retry_after = parse_duration(headers.get("retry-after"))
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    @staticmethod
+    def _is_rate_limit(error: Exception) -> bool:
+        from openai import RateLimitError  # imported lazily: openai is slow to import
+        return isinstance(error, RateLimitError)
+
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        from openai import APIConnectionError, APIStatusError, RateLimitError
+        if isinstance(error, (RateLimitError, APIConnectionError)):
+            return True
+        return isinstance(error, APIStatusError) and error.status_code >= 500
+
+    # ---------- call ----------
+
+    @staticmethod
+    def _key(kwargs: Mapping[str, Any]) -> str:
+        return str(kwargs.get("model") or "default")
+
+    def _pacing_wait(self, key: str, deadline: Optional[float]) -> float:
+        wait = self._reserve_wait(key)
+        if wait > 0:
+            if deadline is not None and time.monotonic() + wait > deadline:
+                wait = max(0.0, deadline - time.monotonic())
+            metrics.observe("upstream.pacing_wait_s", wait)
+        return wait
+
+    def _failure_delay(self, key: str, error: Exception, attempt: int, deadline: Optional[float]) -> Optional[float]:
+        """Returns the delay before the next attempt, or None if the error must be re-raised."""
+        if not self._retryable(error) or attempt >= self.max_retries:
+            metrics.incr("upstream.failures")
+            return None
+        delay = self._retry_delay(error, attempt)
+        if deadline is not None and time.monotonic() + delay > deadline:
+            metrics.incr("upstream.deadline_exceeded")
+            return None
+        if self._is_rate_limit(error):
+            with self._lock:
+                state = self._state(key)
+                state.resume_at = max(state.resume_at, time.monotonic() + delay)
+        metrics.incr("upstream.retries")
+        logservice.logging.warning(
+            "Upstream call failed (%s); retry %d/%d in %.2fs.",
+            type(error).__name__, attempt + 1, self.max_retries, delay,
+        )
+        return delay
+
+    def call(self, fn: Callable[..., Any], *args: Any, deadline: Optional[float] = None, **kwargs: Any) -> Any:
+        deadline = deadline if deadline is not None else current_deadline()
+        key = self._key(kwargs)
+        attempt = 0
+        while True:
+            wait = self._pacing_wait(key, deadline)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                raw = fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._failure_delay(key, e, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+
+            self._observe_headers(key, raw.headers)
+            return raw.parse()
+
+    async def acall(self, fn: Callable[..., Any], *args: Any, deadline: Optional[float] = None, **kwargs: Any) -> Any:
+        """Same as call() for AsyncOpenAI `with_raw_response` methods; sleeps without blocking the loop."""
+        deadline = deadline if deadline is not None else current_deadline()
+        key = self._key(kwargs)
+        attempt = 0
+        while True:
+            wait = self._pacing_wait(key, deadline)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                raw = await fn(*args, **kwargs)
+            except Exception as e:
+                delay = self._failure_delay(key, e, attempt, deadline)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+
+            self._observe_headers(key, raw.headers)
+            return raw.parse()
+
+
+upstream = UpstreamScheduler.from_env()
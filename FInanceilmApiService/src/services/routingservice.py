@@ -0,0 +1,222 @@
+# src/services/routingservice.py
+
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import random
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from src.config import exit_text
+from src.services.metricsservice import metrics
+
+ROUTING_ENABLED = os.getenv("ROUTING_ENABLED", "1") == "1"
+# Chroma distances (lower = closer). The defaults suit the default `l2` space over unit-length
+# OpenAI vectors, where distance = 2 - 2 * cosine similarity.
+# Best chunk farther than this: nothing relevant was retrieved, answer exit_text without the LLM
+ROUTE_OUT_OF_SCOPE_DISTANCE = float(os.getenv("ROUTE_OUT_OF_SCOPE_DISTANCE", "1.5"))
+# Best chunk at least this close (and a simple question): use the light profile
+ROUTE_CONFIDENT_DISTANCE = float(os.getenv("ROUTE_CONFIDENT_DISTANCE", "0.8"))
+# Lexical-only answers have no distance: their top chunk's BM25 score over the query's
+# maximum must reach this for the light profile (retrieval already requires 0.4 to skip vectors)
+ROUTE_LEXICAL_CONFIDENT_RATIO = float(os.getenv("ROUTE_LEXICAL_CONFIDENT_RATIO", "0.7"))
+ROUTE_SIMPLE_MAX_WORDS = int(os.getenv("ROUTE_SIMPLE_MAX_WORDS", "12"))
+# Light profile: a smaller answer budget. The default model (gpt-4o-mini) is already the
+# cheapest we use, so the light profile keeps it unless ROUTE_LIGHT_MODEL names another one.
+ROUTE_LIGHT_MODEL = os.getenv("ROUTE_LIGHT_MODEL", "")
+ROUTE_LIGHT_MAX_TOKENS = int(os.getenv("ROUTE_LIGHT_MAX_TOKENS", "400"))
+# JSON lines for tuning the thresholds offline: a sample of the decisions, in a rotated file.
+# Questions are logged as a hash (repeats still group) unless ROUTING_LOG_QUESTIONS=1.
+# One file per worker process ({pid}): several processes rotating one file lose records.
+ROUTING_LOG_PATH = os.getenv("ROUTING_LOG_PATH", "logs/routing.{pid}.jsonl")
+ROUTING_LOG_SAMPLE = float(os.getenv("ROUTING_LOG_SAMPLE", "0.1"))
+ROUTING_LOG_MAX_BYTES = int(os.getenv("ROUTING_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+ROUTING_LOG_BACKUPS = int(os.getenv("ROUTING_LOG_BACKUPS", "3"))
+ROUTING_LOG_QUESTIONS = os.getenv("ROUTING_LOG_QUESTIONS", "0") == "1"
+
+ROUTES = ("out_of_scope", "light", "full")
+
+# Questions asking to compare, explain or list usually need the full answer budget
+_COMPLEX_CUES = re.compile(
+    r"\b(compare|comparison|differen\w*|vs\.?|versus|explain|why|pros|cons|steps|list|analy\w*|evaluate)\b",
+    re.IGNORECASE,
+)
+
+
+class RouteDecision:
+    """Where a request goes: its route, the canned answer (out_of_scope) or the completion overrides."""
+
+    __slots__ = ("route", "answer", "overrides", "features")
+
+    def __init__(
+        self,
+        route: str,
+        features: Dict[str, Any],
+        answer: Optional[str] = None,
+        overrides: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.route = route
+        self.answer = answer
+        self.overrides = overrides or {}
+        self.features = features
+
+
+class Router:
+    """
+    Routing stage between retrieval and generation, driven by retrieval distances and
+    cheap question features (length, complexity cues).
+
+    - out_of_scope: the best chunk is too far away; reply with exit_text, no LLM call.
+      Only for a conversation's first question: retrieval runs on the last message alone,
+      and a follow-up ("and what about ijara?") can match poorly while being on topic.
+    - light: a close match and a short, simple question; smaller max_tokens (and the
+      light model, if one is configured). A lexical-only answer (exact-term match, chunks
+      without a distance) is in scope, and counts as a close match only when its best
+      BM25 ratio reaches `lexical_confident_ratio`.
+    - full: everything else, with the default completion_kwargs.
+    Every decision is counted (routing.<route>); a `log_sample` share of them is appended
+    to the rotated `log_path` as JSON, with the question hashed unless `log_questions`.
+    `{pid}` in log_path is replaced by the worker's pid when the first decision is logged
+    (after a preload fork), so each process rotates only its own file.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        out_of_scope_distance: float = 1.5,
+        confident_distance: float = 0.8,
+        lexical_confident_ratio: float = 0.7,
+        simple_max_words: int = 12,
+        light_overrides: Optional[Dict[str, Any]] = None,
+        log_path: Optional[str] = None,
+        log_sample: float = 1.0,
+        log_max_bytes: int = 10 * 1024 * 1024,
+        log_backups: int = 3,
+        log_questions: bool = False,
+    ) -> None:
+        self.enabled = enabled
+        self.out_of_scope_distance = out_of_scope_distance
+        self.confident_distance = confident_distance
+        self.lexical_confident_ratio = lexical_confident_ratio
+        self.simple_max_words = simple_max_words
+        self.light_overrides = light_overrides or {}
+        self.log_path = log_path
+        self.log_sample = log_sample
+        self.log_questions = log_questions
+        self.log_max_bytes = log_max_bytes
+        self.log_backups = log_backups
+        self._log: Optional[logging.Logger] = None
+        self._log_pid: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "Router":
+        return cls(
+            enabled=ROUTING_ENABLED,
+            out_of_scope_distance=ROUTE_OUT_OF_SCOPE_DISTANCE,
+            confident_distance=ROUTE_CONFIDENT_DISTANCE,
+            lexical_confident_ratio=ROUTE_LEXICAL_CONFIDENT_RATIO,
+            simple_max_words=ROUTE_SIMPLE_MAX_WORDS,
+            light_overrides={
+                "max_tokens": ROUTE_LIGHT_MAX_TOKENS,
+                **({"model": ROUTE_LIGHT_MODEL} if ROUTE_LIGHT_MODEL else {}),
+            },
+            log_path=ROUTING_LOG_PATH,
+            log_sample=ROUTING_LOG_SAMPLE,
+            log_max_bytes=ROUTING_LOG_MAX_BYTES,
+            log_backups=ROUTING_LOG_BACKUPS,
+            log_questions=ROUTING_LOG_QUESTIONS,
+        )
+
+    def _decision_logger(self) -> Optional[logging.Logger]:
+        if not self.log_path:
+            return None
+        pid = os.getpid()
+        if self._log_pid != pid:
+            self._log_pid = pid
+            self._log = logging.getLogger(f"financeilm.routing.{pid}")
+            self._log.propagate = False  # keep decisions out of logs/logs.log
+        logger = self._log
+        if not logger.handlers:
+            handler = logging.handlers.RotatingFileHandler(
+                self.log_path.format(pid=pid),
+                maxBytes=self.log_max_bytes,
+                backupCount=self.log_backups,
+                encoding="utf-8",
+                delay=True,
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            logger.addHandler(handler)
+            logger.setLevel(logging.INFO)
+        return logger
+
+    # ---------- features ----------
+
+    @staticmethod
+    def features(question: str, chunks: Optional[List[Dict[str, Any]]], follow_up: bool = False) -> Dict[str, Any]:
+        distances = [c["score"] for c in (chunks or []) if c.get("score") is not None]
+        ratios = [c["bm25_ratio"] for c in (chunks or []) if c.get("bm25_ratio") is not None]
+        return {
+            "best_distance": min(distances) if distances else None,
+            "mean_distance": sum(distances) / len(distances) if distances else None,
+            "chunks": len(distances),
+            # chunks from a lexical-only answer: no distance, matched on the exact terms
+            "lexical": sum(1 for c in (chunks or []) if c.get("retrieval") == "lexical"),
+            "lexical_strength": max(ratios) if ratios else None,
+            "words": len(question.split()),
+            "complex": bool(_COMPLEX_CUES.search(question)),
+            "follow_up": follow_up,
+        }
+
+    # ---------- routing ----------
+
+    def route(self, question: str, context: tuple, follow_up: bool = False) -> RouteDecision:
+        """
+        Decides the route from FinanceILM.get_context's (text, link, score, chunks) tuple.
+        `follow_up` is True when the conversation has earlier messages; those never go out_of_scope.
+        """
+        chunks = context[3] if len(context) > 3 else None
+        f = self.features(question, chunks, follow_up)
+        best = f["best_distance"]
+        in_scope = f["lexical"] > 0 or (best is not None and best <= self.out_of_scope_distance)
+        strength = f["lexical_strength"]
+        confident = (strength is not None and strength >= self.lexical_confident_ratio) or (
+            best is not None and best <= self.confident_distance
+        )
+        if not self.enabled:
+            decision = RouteDecision("full", f)
+        elif not in_scope and not follow_up:
+            decision = RouteDecision("out_of_scope", f, answer=exit_text)
+        elif confident and f["words"] <= self.simple_max_words and not f["complex"]:
+            decision = RouteDecision("light", f, overrides=self.light_overrides)
+        else:
+            decision = RouteDecision("full", f)
+        self._record(question, decision)
+        return decision
+
+    def _record(self, question: str, decision: RouteDecision) -> None:
+        metrics.incr(f"routing.{decision.route}")
+        if not self.log_path or random.random() >= self.log_sample:
+            return
+        try:
+            self._decision_logger().info(json.dumps({
+                "ts": round(time.time(), 3),
+                "route": decision.route,
+                "question": question if self.log_questions
+                else hashlib.sha256(question.encode("utf-8")).hexdigest()[:16],
+                **decision.features,
+                "thresholds": {
+                    "out_of_scope_distance": self.out_of_scope_distance,
+                    "confident_distance": self.confident_distance,
+                    "lexical_confident_ratio": self.lexical_confident_ratio,
+                    "simple_max_words": self.simple_max_words,
+                },
+                "overrides": decision.overrides,
+            }, ensure_ascii=False))
+        except Exception:
+            pass  # decision logging must never fail a request
+
+
+router = Router.from_env()
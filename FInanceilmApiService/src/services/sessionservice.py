@@ -0,0 +1,121 @@
+# src/services/sessionservice.py
+
+import os
+from typing import List, Optional
+
+from src.config import get_tokenizer
+from src.models import Message
+from src.services.cacheservice import MISSING, CacheBackend, get_cache
+from src.services.metricsservice import metrics
+
+# Messages kept per session: acompletion_v1 only ever sends the last 4
+SESSION_WINDOW_MESSAGES = int(os.getenv("SESSION_WINDOW_MESSAGES", "4"))
+# Idle sessions expire after this long
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "1800"))
+# Size budget per session window; the oldest messages are dropped beyond it (the newest always stays)
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", str(64 * 1024)))
+# Sessions kept in the store; least recently used sessions go first.
+# The store is bounded by roughly SESSION_STORE_MAX_ENTRIES x SESSION_MAX_BYTES.
+SESSION_STORE_MAX_ENTRIES = int(os.getenv("SESSION_STORE_MAX_ENTRIES", "20000"))
+# Follow-up turns may land on any worker, so windows live in the host-shared store (sqlite)
+# whatever CACHE_BACKEND says. "local" is only correct with a single worker process.
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "sqlite")
+
+# Rough per-message overhead (role, list slots, JSON framing) added to the content size
+_MESSAGE_OVERHEAD_BYTES = 64
+
+
+class SessionNotFound(KeyError):
+    """The session is unknown (never created, expired or evicted)."""
+
+
+class SessionTurn:
+    """A turn read from the store but not yet recorded; see SessionStore.commit."""
+
+    __slots__ = ("session_id", "entries", "messages", "tokens")
+
+    def __init__(self, session_id: str, entries: List[list]) -> None:
+        self.session_id = session_id
+        # [role, content, token count]
+        self.entries = entries
+        self.messages = [Message(role=r, content=c) for r, c, _t in entries]
+        self.tokens = sum(e[2] for e in entries)
+
+
+class SessionStore:
+    """
+    Server-side conversation windows, so clients send only the new message each turn.
+
+    - Each session keeps its last `window` messages with their token counts computed once,
+      so admission estimates don't re-tokenize the history on every turn.
+    - A window holds at most `max_bytes` (approximate) of messages.
+    - Windows are kept in a cache backend (host-shared SQLite by default, so every worker
+      sees them), with a `ttl` refreshed on every answered turn and LRU eviction.
+    - A turn is read with begin() and written with commit() only once it was answered:
+      a rejected or failed request leaves the session untouched, so retrying it doesn't
+      duplicate the message. Concurrent turns on one session: the last answer wins.
+    An unknown session raises SessionNotFound and the client re-seeds it by sending its
+    history in `messages`.
+    """
+
+    def __init__(self, window: int, max_bytes: int, cache: Optional[CacheBackend] = None) -> None:
+        self.window = max(1, window)
+        self.max_bytes = max_bytes
+        self._cache = cache
+
+    @classmethod
+    def from_env(cls) -> "SessionStore":
+        return cls(SESSION_WINDOW_MESSAGES, SESSION_MAX_BYTES)
+
+    # ---------- helpers ----------
+
+    def _store(self) -> CacheBackend:
+        # opened on first use, so importing the app doesn't create the cache file
+        if self._cache is None:
+            self._cache = get_cache(
+                "sessions", max_entries=SESSION_STORE_MAX_ENTRIES, ttl=SESSION_TTL_S, backend=SESSION_STORE_BACKEND
+            )
+        return self._cache
+
+    @staticmethod
+    def _entry(role: str, content: str) -> list:
+        return [role, content or "", len(get_tokenizer().encode(content or "", disallowed_special=()))]
+
+    def _trim(self, entries: List[list]) -> List[list]:
+        entries = entries[-self.window:]
+        size = sum(len(e[1].encode("utf-8")) + _MESSAGE_OVERHEAD_BYTES for e in entries)
+        while size > self.max_bytes and len(entries) > 1:
+            size -= len(entries[0][1].encode("utf-8")) + _MESSAGE_OVERHEAD_BYTES
+            entries = entries[1:]
+            metrics.incr("sessions.trimmed")
+        return entries
+
+    # ---------- API ----------
+
+    async def begin(self, session_id: str, history: List[Message], message: Optional[Message]) -> SessionTurn:
+        """
+        Returns this turn's window (stored messages plus the new ones) without recording it.
+
+        A non-empty `history` (re)seeds the session; otherwise `message` is appended to the
+        stored window, which raises SessionNotFound if the session is unknown.
+        """
+        new = list(history) + ([message] if message is not None else [])
+        if history:
+            stored = []
+        else:
+            stored = await self._store().aget(session_id)
+            if stored is MISSING:
+                metrics.incr("sessions.missing")
+                raise SessionNotFound(session_id)
+        entries = self._trim(stored + [self._entry(m.role, m.content) for m in new[-self.window:]])
+        return SessionTurn(session_id, entries)
+
+    async def commit(self, turn: SessionTurn, reply: str) -> None:
+        """Records an answered turn: its window plus the assistant's reply, for the next turn."""
+        if not reply:
+            return
+        await self._store().aset(turn.session_id, self._trim(turn.entries + [self._entry("assistant", reply)]))
+        metrics.incr("sessions.turns")
+
+
+sessions = SessionStore.from_env()
@@ -0,0 +1,138 @@
+# src/services/streamservice.py
+
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from src.services import logservice
+from src.services.metricsservice import metrics
+
+# Streaming protocols supported by /api/v1/context-in-usage
+#   legacy: OpenAI chunks as JSON, context attached to the final usage chunk
+#   events: typed NDJSON events -> context, delta..., usage
+STREAM_PROTOCOLS = ("legacy", "events")
+
+
+def encode_event(event: str, data: Dict[str, Any]) -> str:
+    """One NDJSON frame of the `events` protocol: {"event": ..., "data": {...}}."""
+    return json.dumps({"event": event, "data": data}) + "\n"
+
+
+def chunk_delta(chunk: Any) -> Optional[str]:
+    """Returns the text delta of an OpenAI ChatCompletionChunk, or None (e.g. the usage tail)."""
+    choices = getattr(chunk, "choices", None)
+    if not choices:
+        return None
+    delta = getattr(choices[0], "delta", None)
+    return getattr(delta, "content", None) if delta is not None else None
+
+
+class DeltaCoalescer:
+    """
+    Buffers token deltas so a stream writes a few larger frames instead of one per token.
+
+    - The first delta is flushed immediately (TTFB does not regress).
+    - Afterwards a flush happens when the window has elapsed since the last flush,
+      when the buffer reaches max_bytes, or when the buffer ends on a sentence boundary.
+    window_ms=0 disables coalescing. The window is checked as deltas arrive.
+    """
+
+    SENTENCE_ENDINGS = (".", "!", "?", "\n", "؟", "۔", ":")
+
+    def __init__(self, window_ms: Optional[float] = None, max_bytes: Optional[int] = None) -> None:
+        self.window_s = (window_ms if window_ms is not None else float(os.getenv("STREAM_COALESCE_WINDOW_MS", "30"))) / 1000.0
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("STREAM_COALESCE_MAX_BYTES", "256"))
+        self._parts: List[str] = []
+        self._size = 0
+        self._last_flush: Optional[float] = None
+
+    def push(self, delta: str) -> Optional[str]:
+        """Adds a delta; returns the text to send now, or None to keep buffering."""
+        self._parts.append(delta)
+        self._size += len(delta.encode("utf-8"))
+        if (
+            self._last_flush is None
+            or self.window_s <= 0
+            or self._size >= self.max_bytes
+            or delta.rstrip(" ").endswith(self.SENTENCE_ENDINGS)
+            or time.monotonic() - self._last_flush >= self.window_s
+        ):
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[str]:
+        """Returns whatever is buffered (None if empty) and resets the window."""
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        self._parts.clear()
+        self._size = 0
+        self._last_flush = time.monotonic()
+        return text
+
+
+class FrameMeter:
+    """Counts frames and bytes written for one streamed response."""
+
+    def __init__(self) -> None:
+        self.frames = 0
+        self.bytes = 0
+
+    def count(self, frame: str) -> str:
+        self.frames += 1
+        size = len(frame.encode("utf-8"))
+        self.bytes += size
+        metrics.observe("stream.bytes_per_frame", size)
+        return frame
+
+    def close(self) -> None:
+        metrics.observe("stream.frames_per_response", self.frames)
+        metrics.observe("stream.bytes_per_response", self.bytes)
+
+
+async def guarded_stream(
+    stream: Any,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    max_tokens: Optional[int] = None,
+    poll_ms: Optional[float] = None,
+) -> AsyncIterator[Any]:
+    """
+    Yields chunks from an upstream AsyncStream and closes it as soon as the client is gone.
+
+    - is_disconnected (e.g. Request.is_disconnected) is polled at most every poll_ms.
+    - The upstream stream is also closed when the consumer stops early or is cancelled
+      (Starlette cancels the response task on disconnect).
+    - Abandoned streams are counted (stream.abandoned), with the deltas received before the
+      client left (stream.abandoned_after_deltas) and the part of the max_tokens budget left
+      unused (stream.tokens_unspent_budget). The latter is an upper bound on the tokens
+      saved: most answers end well before max_tokens anyway.
+    """
+    poll_s = (poll_ms if poll_ms is not None else float(os.getenv("STREAM_DISCONNECT_POLL_MS", "250"))) / 1000.0
+    last_poll = time.monotonic()
+    deltas = 0
+    finished = False
+    try:
+        async for chunk in stream:
+            if chunk_delta(chunk):
+                deltas += 1
+            if is_disconnected is not None and time.monotonic() - last_poll >= poll_s:
+                last_poll = time.monotonic()
+                if await is_disconnected():
+                    break
+            yield chunk
+        else:
+            finished = True
+    except Exception:
+        finished = True  # upstream failure, not an abandoned stream
+        raise
+    finally:
+        if not finished:
+            metrics.incr("stream.abandoned")
+            metrics.observe("stream.abandoned_after_deltas", deltas)
+            if max_tokens:
+                metrics.incr("stream.tokens_unspent_budget", max(0, max_tokens - deltas))
+            logservice.logging.info("Client went away; closing upstream stream after %d deltas.", deltas)
+        close = getattr(stream, "close", None)
+        if close is not None:
+            await close()
@@ -0,0 +1,116 @@
+from src.config import stream_completion_kwargs_with_usage
+from src.models import Message
+from src.prompt import prompts_on_source
+from src.services.openaiservice import aparsed_completion_v1, record_usage
+from src.config import completion_kwargs
+from typing import TYPE_CHECKING, Optional
+import time
+import uuid
+
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion import ChatCompletion
+    from src.services.routingservice import RouteDecision
+
+
+def canned_completion(text: str, model: str = "router") -> "ChatCompletion":
+    """A ChatCompletion carrying a fixed answer, for requests answered without the LLM."""
+    from openai.types.chat.chat_completion import ChatCompletion
+
+    return ChatCompletion(
+        id=f"canned-{uuid.uuid4().hex}",
+        object="chat.completion",
+        created=int(time.time()),
+        model=model,
+        choices=[{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": text}}],
+        usage={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    )
+
+
+class CannedStream:
+    """
+    Async stream of ChatCompletionChunks for a fixed answer: one content chunk, the finish
+    chunk and a zero-usage tail, like a real stream with include_usage. Has close() so it
+    goes through guarded_stream unchanged.
+    """
+
+    def __init__(self, text: str, model: str = "router") -> None:
+        from openai.types.chat import ChatCompletionChunk
+
+        base = {"id": f"canned-{uuid.uuid4().hex}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model}
+        self._chunks = [
+            ChatCompletionChunk(**base, choices=[{"index": 0, "delta": {"role": "assistant", "content": text}}]),
+            ChatCompletionChunk(**base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]),
+            ChatCompletionChunk(**base, choices=[], usage={"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}),
+        ]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._chunks:
+            raise StopAsyncIteration
+        return self._chunks.pop(0)
+
+    async def close(self) -> None:
+        self._chunks = []
+
+
+async def acompletion_v1(
+    context,
+    message_history: list[Message],
+    referrer: str,
+    route: Optional["RouteDecision"] = None
+) -> "ChatCompletion":
+    """
+    Generates a completion for a given prompt, awaiting AsyncOpenAI instead of holding a
+    thread for the whole generation.
+
+    Args:
+        context: The context of the prompt, taken from sources.
+        message_history: The message history of the conversation.
+        referrer: Which IC property the prompt came from.
+        route: Routing decision (see src/services/routingservice.py): a canned answer
+            skips the LLM, overrides replace completion_kwargs entries.
+
+    Returns:
+        ChatCompletion: The generated chat completion.
+    """
+    if route is not None and route.answer is not None:
+        return canned_completion(route.answer)
+    messages = [
+        {"role": "system", "content": prompts_on_source(referrer, context[0], context[2])},
+    ]
+    messages.extend(message_history[-4:])
+
+    overrides = route.overrides if route is not None else {}
+    res = await aparsed_completion_v1(**{**completion_kwargs, **overrides}, messages=messages)
+    record_usage(getattr(res, "usage", None))
+    return res
+    
+async def completion_v1_stream(context, message_history: list[Message], referrer: str, route: Optional["RouteDecision"] = None):
+    """
+    Generates a streaming completion for a given prompt.
+    Returns an AsyncStream of chunks; close() it to stop the upstream generation.
+
+    Args:
+        context: The context of the prompt, taken from sources.
+        message_history: The message history of the conversation.
+        referrer: Which IC property the prompt came from.
+        route: Routing decision: a canned answer is streamed without calling the LLM,
+            overrides replace completion_kwargs entries.
+    """
+    if route is not None and route.answer is not None:
+        return CannedStream(route.answer)
+    messages = [
+        {"role": "system", "content": prompts_on_source(referrer, context[0], context[2])},
+    ]
+    
+    history = message_history[-4:]
+    messages.extend(history)
+
+
+    req_kwargs = {**stream_completion_kwargs_with_usage, **(route.overrides if route is not None else {})}
+    res = await aparsed_completion_v1(**req_kwargs, messages=messages)
+
+    return res
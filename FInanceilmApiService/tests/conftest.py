@@ -0,0 +1,7 @@
+import os
+import sys
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+# logservice writes to the relative logs/logs.log at import
+os.chdir(SERVICE_DIR)
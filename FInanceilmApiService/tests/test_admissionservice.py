@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from src.services.admissionservice import AdmissionController, AdmissionRejected
+
+
+def controller(**overrides) -> AdmissionController:
+    settings = dict(max_concurrency=2, per_token_concurrency=2, max_queue=4, max_queue_wait_s=1.0, tokens_per_minute=0)
+    settings.update(overrides)
+    return AdmissionController(**settings)
+
+
+def test_per_token_default_is_the_global_limit(monkeypatch):
+    monkeypatch.setenv("ADMISSION_MAX_CONCURRENCY", "64")
+    monkeypatch.delenv("ADMISSION_PER_TOKEN_CONCURRENCY", raising=False)
+    assert AdmissionController.from_env().per_token_concurrency == 64
+
+
+def test_over_per_token_limit_waits_instead_of_rejecting():
+    async def main():
+        ac = controller(max_concurrency=4, per_token_concurrency=1)
+        first = await ac.acquire("t", 0)
+        waiter = asyncio.create_task(ac.acquire("t", 0))
+        await asyncio.sleep(0.01)
+        assert not waiter.done() and ac._active == 1
+        first.release()
+        second = await asyncio.wait_for(waiter, 1)
+        assert ac._active == 1 and ac._per_token == {"t": 1}
+        second.release()
+        assert ac._active == 0 and not ac._per_token
+
+    asyncio.run(main())
+
+
+def test_released_slot_skips_waiters_whose_token_is_at_its_limit():
+    async def main():
+        ac = controller(max_concurrency=2, per_token_concurrency=1)
+        a = await ac.acquire("a", 0)
+        a_waiter = asyncio.create_task(ac.acquire("a", 0))
+        await asyncio.sleep(0.01)
+        b = await ac.acquire("b", 0)  # a global slot is free and "b" is under its limit
+        c_waiter = asyncio.create_task(ac.acquire("c", 0))
+        await asyncio.sleep(0.01)
+        b.release()  # "a" is still at its limit, so the slot goes to "c"
+        c = await asyncio.wait_for(c_waiter, 1)
+        assert not a_waiter.done()
+        a.release()
+        (await asyncio.wait_for(a_waiter, 1)).release()
+        c.release()
+        assert ac._active == 0 and not ac._waiters
+
+    asyncio.run(main())
+
+
+def test_queue_full_and_timeout_reject_and_refund_the_estimate():
+    async def main():
+        ac = controller(max_concurrency=1, max_queue=1, max_queue_wait_s=0.05, tokens_per_minute=6000)
+        held = await ac.acquire("t", 1000)
+        waiter = asyncio.create_task(ac.acquire("t", 1000))
+        await asyncio.sleep(0.01)
+        with pytest.raises(AdmissionRejected) as full:
+            await ac.acquire("t", 1000)
+        assert full.value.reason == "queue_full"
+        with pytest.raises(AdmissionRejected) as timeout:
+            await waiter
+        assert timeout.value.reason == "queue_timeout"
+        assert ac.bucket.tokens == pytest.approx(5000, abs=20)  # only the admitted estimate is held
+        held.release()
+        assert ac._active == 0 and not ac._waiters
+
+    asyncio.run(main())
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def main():
+        ac = controller(max_concurrency=1)
+        held = await ac.acquire("t", 0)
+        waiter = asyncio.create_task(ac.acquire("t", 0))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        held.release()
+        assert ac._active == 0 and not ac._waiters and not ac._per_token
+
+    asyncio.run(main())
+
+
+def test_release_settles_the_estimate_with_the_real_usage():
+    async def main():
+        ac = controller(tokens_per_minute=6000)
+        ticket = await ac.acquire("t", 3000)
+        ticket.record_usage({"prompt_tokens": 400, "completion_tokens": 100})
+        ticket.release()
+        assert ac.bucket.tokens == pytest.approx(5500, abs=5)
+
+        canned = await ac.acquire("t", 3000)
+        canned.record_usage({"prompt_tokens": 0, "completion_tokens": 0})  # answered without the LLM
+        canned.release()
+        assert ac.bucket.tokens == pytest.approx(5500, abs=5)
+
+        unknown = await ac.acquire("t", 1000)  # e.g. a stream abandoned before its usage tail
+        unknown.release()
+        assert ac.bucket.tokens == pytest.approx(4500, abs=5)
+
+    asyncio.run(main())
@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from src.services import cacheservice
+from src.services.cacheservice import MISSING, CacheBackend, SQLiteCache, decode_value, encode_value
+
+
+def test_cache_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend("ns", 10, 1.0)
+
+
+def test_values_round_trip_without_pickle():
+    vector = [0.25, -1.5, 3.0]
+    assert encode_value(vector)[:1] == b"f"
+    assert decode_value(encode_value(vector)) == vector
+    context = {"text": "sukuk", "link": {}, "chunks": [{"id": "c1", "score": 0.4}]}
+    assert decode_value(encode_value(context)) == context
+    with pytest.raises(ValueError):
+        decode_value(b"\x80\x04pickled")
+
+
+def test_sqlite_cache_is_private_and_ignores_unreadable_rows(tmp_path):
+    path = tmp_path / "cache" / "cache.sqlite3"
+    cache = SQLiteCache("ns", str(path))
+    assert os.stat(path.parent).st_mode & 0o777 == 0o700
+    assert os.stat(path).st_mode & 0o777 == 0o600
+    cache.set("k", [0.5, 0.25])
+    assert cache.get("k") == [0.5, 0.25]
+    cache._conn().execute("UPDATE cache SET value = ? WHERE key = 'k'", (b"\x80\x04pickled",))
+    assert cache.get("k") is MISSING
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="POSIX permissions")
+def test_sqlite_cache_refuses_a_shared_directory(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+    with pytest.raises(PermissionError):
+        SQLiteCache("ns", str(shared / "cache.sqlite3"))
+
+
+def test_context_store_is_shared_even_with_the_local_backend(tmp_path, monkeypatch):
+    from src.services import contextstore
+
+    monkeypatch.setenv("CACHE_BACKEND", "local")
+    monkeypatch.setenv("CACHE_PATH", str(tmp_path / "cache" / "cache.sqlite3"))
+    monkeypatch.setattr(cacheservice, "_caches", {})
+    assert isinstance(contextstore._store(), SQLiteCache)
+    assert not isinstance(cacheservice.get_cache("embeddings"), SQLiteCache)
+
+
+def test_sqlite_cache_hits_only_touch_stale_rows(tmp_path):
+    cache = SQLiteCache("ns", str(tmp_path / "cache" / "cache.sqlite3"), ttl=100.0)
+    cache.set("k", {"v": 1})
+    accessed = lambda: cache._conn().execute("SELECT accessed_at FROM cache WHERE key = 'k'").fetchone()[0]
+    cache._conn().execute("UPDATE cache SET accessed_at = accessed_at - 5 WHERE key = 'k'")
+    before = accessed()
+    assert cache.get("k") == {"v": 1}
+    assert accessed() == before  # younger than ttl/10: read-only hit
+    cache._conn().execute("UPDATE cache SET accessed_at = accessed_at - 20 WHERE key = 'k'")
+    cache.get("k")
+    assert accessed() > before
@@ -0,0 +1,64 @@
+from src.services.lexicalservice import LexicalIndex, LexicalService, rrf_fuse
+
+
+def _corpus(n=40):
+    # filler chunks keep the rare terms' idf realistic (above LEXICAL_MIN_IDF)
+    return [f"f{i}" for i in range(n)], [f"islamic finance contract murabaha note {i}" for i in range(n)]
+
+
+def test_bm25_ranks_term_frequency_and_reports_coverage():
+    index = LexicalIndex()
+    ids, docs = _corpus()
+    index.upsert_many(ids + ["once", "twice"], docs + ["ijara lease", "ijara ijara lease"])
+    hits, info = index.search("ijara lease", k=5)
+    assert [cid for cid, _s, _c in hits] == ["twice", "once"]
+    assert all(coverage == 1.0 for _cid, _s, coverage in hits)
+    assert info["terms"] == 2 and hits[0][1] <= info["max_score"]
+    hits, _info = index.search("ijara sukuk", k=5)
+    assert hits[0][2] == 0.5
+
+
+def test_upserts_and_removals_tombstone_old_documents():
+    index = LexicalIndex()
+    index.upsert_many(["c1", "c2"], ["sukuk issuance", "takaful pool"])
+    index.upsert_many(["c1"], ["wakala agency"])
+    assert index.search("sukuk", k=5)[0] == []
+    assert [cid for cid, _s, _c in index.search("wakala", k=5)[0]] == ["c1"]
+    index.remove_many(["c2", "missing"])
+    assert index.search("takaful", k=5)[0] == [] and "c2" not in index and len(index) == 1
+
+
+def test_compaction_drops_tombstones_and_keeps_results():
+    index = LexicalIndex()
+    ids, docs = _corpus(8)
+    index.upsert_many(ids, docs)
+    index.upsert_many(["rare"], ["istisna manufacturing"])
+    index.remove_many(ids[:2])
+    assert index._dead == 2  # 2 of 9 documents: below the quarter threshold
+    index.remove_many(ids[2:4])
+    assert index._dead == 0 and len(index._ids) == 5
+    assert index.stats()["docs"] == 5
+    assert [cid for cid, _s, _c in index.search("istisna", k=3)[0]] == ["rare"]
+    assert {cid for cid, _s, _c in index.search("murabaha", k=10)[0]} == set(ids[4:])
+
+
+def test_rrf_fuse_rewards_ids_in_both_rankings():
+    fused = rrf_fuse([["a", "b"], ["c", "a"]], k=60)
+    assert fused["a"] == 1 / 61 + 1 / 62
+    assert fused["b"] == 1 / 62 and fused["c"] == 1 / 61
+    assert sorted(fused, key=fused.get, reverse=True) == ["a", "c", "b"]
+
+
+def test_is_confident_only_for_short_complete_rare_term_matches():
+    service = LexicalService(enabled=True, refresh_s=300, rebuild_s=3600, page_size=100)
+    index = LexicalIndex()
+    ids, docs = _corpus()
+    index.upsert_many(ids + ["std"], docs + ["aaoifi shariah standard 21 financial papers issued"])
+    assert service.is_confident(*index.search("AAOIFI standard 21", k=5))
+    # common terms only: no rare term to anchor an exact-term lookup
+    assert not service.is_confident(*index.search("islamic finance contract", k=5))
+    # the best chunk misses a query term
+    assert not service.is_confident(*index.search("aaoifi standard tawarruq", k=5))
+    # too long to be a lookup
+    assert not service.is_confident(*index.search("aaoifi shariah standard 21 financial papers issued", k=5))
+    assert not service.is_confident([], {"terms": 0, "max_idf": 0.0, "max_score": 0.0})
@@ -0,0 +1,31 @@
+import asyncio
+
+from src.services import readinessservice
+from src.services.readinessservice import Readiness
+
+
+def test_ready_worker_is_rechecked_after_the_ttl(monkeypatch):
+    monkeypatch.setattr(readinessservice, "READINESS_TTL_S", 0.0)
+    monkeypatch.setattr(readinessservice, "WARMUP_QUERIES_FILE", None)
+    up = {"chroma": True}
+
+    async def ok():
+        return None
+
+    async def chroma():
+        if not up["chroma"]:
+            raise ConnectionError("chroma is down")
+
+    async def scenario():
+        readiness = Readiness()
+        monkeypatch.setattr(readiness, "_tokenizer", ok)
+        monkeypatch.setattr(readiness, "_openai", ok)
+        monkeypatch.setattr(readiness, "_chroma", chroma)
+        assert await readiness.warm_up()
+        up["chroma"] = False
+        assert readiness.status()["ready"]  # answers from the last result, starts a re-check
+        await readiness._task
+        status = readiness.status()
+        assert not status["ready"] and not status["checks"]["chroma"]["ok"]
+
+    asyncio.run(scenario())
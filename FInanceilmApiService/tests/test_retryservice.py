@@ -0,0 +1,61 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import RateLimitError
+
+from src.services.retryservice import UpstreamScheduler, parse_duration
+
+
+class Raw:
+    def __init__(self, headers=None, value="ok"):
+        self.headers = headers or {}
+        self._value = value
+
+    def parse(self):
+        return self._value
+
+
+def rate_limit(retry_after_ms: str) -> RateLimitError:
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    response = httpx.Response(429, request=request, headers={"retry-after-ms": retry_after_ms})
+    return RateLimitError("rate limited", response=response, body=None)
+
+
+def test_parse_duration():
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("6m0s") == pytest.approx(360)
+    assert parse_duration("1.5") == pytest.approx(1.5)
+    assert parse_duration("soon") is None
+
+
+def test_rate_limit_pauses_only_the_limited_model():
+    async def main():
+        scheduler = UpstreamScheduler(max_retries=1)
+        calls = []
+
+        async def embed(**kwargs):
+            calls.append(kwargs["model"])
+            if len(calls) == 1:
+                raise rate_limit("300")
+            return Raw()
+
+        task = asyncio.create_task(scheduler.acall(embed, model="text-embedding-3-small"))
+        await asyncio.sleep(0.05)
+        assert scheduler._reserve_wait("gpt-4o-mini") == 0.0
+        assert scheduler._reserve_wait("text-embedding-3-small") > 0.1
+        assert await task == "ok"
+
+    asyncio.run(main())
+
+
+def test_healthy_headers_of_one_model_keep_another_models_pacing():
+    scheduler = UpstreamScheduler(low_watermark=0.1)
+    low = {"x-ratelimit-remaining-requests": "1", "x-ratelimit-limit-requests": "100",
+           "x-ratelimit-reset-requests": "2s"}
+    healthy = {"x-ratelimit-remaining-requests": "99", "x-ratelimit-limit-requests": "100",
+               "x-ratelimit-reset-requests": "1s"}
+    scheduler._observe_headers("text-embedding-3-small", low)
+    scheduler._observe_headers("gpt-4o-mini", healthy)
+    assert scheduler._reserve_wait("text-embedding-3-small") > 1.0
+    assert scheduler._reserve_wait("gpt-4o-mini") == 0.0
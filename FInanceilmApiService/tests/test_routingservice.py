@@ -0,0 +1,34 @@
+from src.config import exit_text
+from src.services.routingservice import Router
+
+
+def _context(*distances):
+    return "text", {}, sum(distances) / len(distances), [{"id": f"c{i}", "score": d} for i, d in enumerate(distances)]
+
+
+def test_only_a_first_question_is_answered_out_of_scope():
+    router = Router(light_overrides={"max_tokens": 400})
+    first = router.route("who won the football match", _context(1.8, 1.9))
+    assert first.route == "out_of_scope" and first.answer == exit_text
+    follow_up = router.route("and what about silver", _context(1.8, 1.9), follow_up=True)
+    assert follow_up.route == "full" and follow_up.answer is None
+
+
+def test_light_profile_for_close_simple_questions():
+    router = Router(light_overrides={"max_tokens": 400})
+    assert router.route("zakat nisab threshold", _context(0.5, 0.6)).overrides == {"max_tokens": 400}
+    assert router.route("compare murabaha and ijara", _context(0.5, 0.6)).route == "full"
+
+
+def test_lexical_only_answers_go_light_only_on_a_strong_bm25_match():
+    router = Router(light_overrides={"max_tokens": 400}, lexical_confident_ratio=0.7)
+
+    def lexical(ratio):
+        return "text", {}, None, [{"id": "c1", "score": None, "retrieval": "lexical", "bm25_ratio": ratio}]
+
+    strong = router.route("AAOIFI Shariah Standard 21", lexical(0.9))
+    assert strong.route == "light"
+    assert strong.features["best_distance"] is None and strong.features["lexical"] == 1
+    assert strong.features["lexical_strength"] == 0.9
+    # a weak exact-term match is still in scope, but gets the full answer budget
+    assert router.route("AAOIFI Shariah Standard 21", lexical(0.45)).route == "full"
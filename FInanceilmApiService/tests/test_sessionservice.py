@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from src.models import Message
+from src.services import sessionservice
+from src.services.cacheservice import LocalCache
+from src.services.sessionservice import SessionNotFound, SessionStore
+
+
+class _WordTokenizer:
+    def encode(self, text, disallowed_special=()):
+        return text.split()
+
+
+@pytest.fixture(autouse=True)
+def _tokenizer(monkeypatch):
+    # tiktoken downloads its BPE file on first use
+    monkeypatch.setattr(sessionservice, "get_tokenizer", _WordTokenizer)
+
+
+def _user(text):
+    return Message(role="user", content=text)
+
+
+def test_turn_is_recorded_only_when_committed():
+    store = SessionStore(window=4, max_bytes=10_000, cache=LocalCache("sessions"))
+
+    async def scenario():
+        first = await store.begin("s", [_user("what is sukuk")], None)
+        await store.commit(first, "an asset-backed certificate")
+        # a failed turn is never committed, so retrying it doesn't duplicate the message
+        await store.begin("s", [], _user("and ijara"))
+        retry = await store.begin("s", [], _user("and ijara"))
+        assert [m.content for m in retry.messages] == ["what is sukuk", "an asset-backed certificate", "and ijara"]
+        assert retry.tokens == 3 + 3 + 2
+        with pytest.raises(SessionNotFound):
+            await store.begin("unknown", [], _user("hi"))
+
+    asyncio.run(scenario())
+
+
+def test_window_is_bounded_by_messages_and_bytes():
+    store = SessionStore(window=2, max_bytes=400, cache=LocalCache("sessions"))
+
+    async def scenario():
+        turn = await store.begin("s", [_user("a"), _user("b"), _user("c")], None)
+        assert [m.content for m in turn.messages] == ["b", "c"]
+        turn = await store.begin("s", [_user("x" * 300), _user("y" * 300)], None)
+        assert [m.content for m in turn.messages] == ["y" * 300]
+
+    asyncio.run(scenario())